@@ -0,0 +1,352 @@
+"""
+Compilation throughput benchmark.
+
+Times lexing, parsing, every compiler stage and dumping separately,
+on test programs and on synthetic programs of growing size.
+Results are compared against a stored baseline, and stages, whose time grows faster than
+the size of the program, are reported
+"""
+
+
+import gc
+import os
+import sys
+import json
+import math
+import logging
+import tempfile
+import tracemalloc
+from glob import glob
+from time import perf_counter
+from argparse import ArgumentParser, Namespace
+
+# run as a script from any directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from source.lexer import Lexer
+from source.parser import Parser
+from source.linker import Linker
+from source.compiler import Compiler
+from source.optimizer import PassManager
+from source.file_io import dump
+from source.built_ins import *
+
+
+LOGGER = logging.getLogger("benchmark")
+
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baseline.json")
+TESTS_PATTERN = os.path.join(ROOT, "tests", "*.ql")
+SYNTHETIC_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+# compiler stages, in order they are run
+COMPILER_STAGES = [
+    ("preprocess", "_preprocess_stage"),
+    ("first", "_compile_first_stage"),
+    ("second", "_compile_second_stage"),
+    ("third", "_compile_third_stage"),
+    ("forth", "_compile_forth_stage"),
+    ("optimization", "_optimization_stage"),
+    ("layout", "_layout_stage"),
+    ("fifth", "_compile_fifth_stage"),
+]
+STAGES = ["lexer", "parser"] + [name for name, _ in COMPILER_STAGES] + ["dump"]
+
+# stages faster than this are too noisy to be compared
+MIN_SECONDS = 0.005
+
+# time growth exponent, above which a stage is reported as superlinear
+MAX_EXPONENT = 1.5
+
+
+def make_synthetic(lines: int) -> str:
+    """
+    Makes a program of about given amount of lines, using defines, macros, labels, jumps and subroutines
+    :param lines: amount of lines
+    :return: program source
+    """
+
+    output = [
+        "#define BASE 0x100",
+        "#define STEP BASE + 1",
+        "macro bump uses v amount",
+        "    load v",
+        "    add amount",
+        "    store v",
+        "",
+    ]
+
+    # one subroutine every 500 lines
+    subroutines = max(1, lines // 500)
+    for idx in range(subroutines):
+        output += [
+            f"subr s{idx} uses a b",
+            "    load $a",
+            "    add $b",
+            f"    store $t{idx % 10}",
+            "    comp 16",
+            f"    loadpr @done{idx}",
+            "    jumpc 0b00_1000",
+            f"    bump uses $t{idx % 10} 1",
+            f"    @done{idx}",
+            "    return",
+            "",
+        ]
+
+    # variables are defined before they are passed to subroutines
+    for idx in range(50):
+        output += [f"load {idx}", f"store $v{idx}"]
+
+    idx = 0
+    while len(output) < lines - 1:
+        output += [
+            f"@l{idx}",
+            f"load {idx % 100}",
+            f"store $v{idx % 50}",
+            f"bump uses $v{idx % 50} STEP",
+            f"call s{idx % subroutines} uses $v{idx % 50} $v{(idx + 1) % 50}",
+            f"loadpr @l{idx}",
+            "jumpc 0b00_1000    ; loop",
+            "",
+        ]
+        idx += 1
+    output.append("halt")
+    return "\n".join(output) + "\n"
+
+
+def run_stages(name: str, source: str, args: Namespace, path: str | None = None, trace: bool = False) -> dict:
+    """
+    Compiles a program once, measuring every stage
+    :param name: program name
+    :param source: program source
+    :param args: benchmark arguments
+    :param path: source file path, for included files
+    :param trace: measure peak memory instead of time
+    :return: stage name -> seconds, or peak memory in bytes when tracing
+    """
+
+    namespace = NamespaceQMr11() if args.namespace == "QM" else NamespaceQT()
+    results = dict()
+
+    def measure(stage: str, function, *arguments):
+        if trace:
+            tracemalloc.reset_peak()
+            start = tracemalloc.get_traced_memory()[0]
+            function(*arguments)
+            results[stage] = tracemalloc.get_traced_memory()[1] - start
+        else:
+            # garbage collection pauses are left out, like in 'timeit'
+            gc.collect()
+            gc.disable()
+            try:
+                start = perf_counter()
+                function(*arguments)
+                results[stage] = perf_counter() - start
+            finally:
+                gc.enable()
+
+    def lex():
+        lexer.import_code(source)
+        lexer.evaluate()
+
+    def parse():
+        parser.import_scope(lexer.current_scope)
+        parser.parse()
+
+    lexer = Lexer()
+    lexer.code_namespace = namespace
+    measure("lexer", lex)
+
+    parser = Parser()
+    measure("parser", parse)
+
+    compiler = Compiler()
+    compiler.code_namespace = namespace
+    compiler.source_path = path
+    compiler.linker = Linker(namespace)
+    compiler.optimizer = PassManager(namespace, args.optimization)
+    compiler.import_scope(parser.current_scope)
+    for stage, method in COMPILER_STAGES:
+        measure(stage, getattr(compiler, method))
+
+    # address overflow is not checked, so programs of any size can be measured
+    with tempfile.TemporaryDirectory() as directory:
+        measure("dump", dump, compiler.bytecode, os.path.join(directory, f"{name}.bin"), namespace)
+    return results
+
+
+def benchmark(name: str, source: str, args: Namespace, path: str | None = None) -> dict:
+    """
+    Measures time and peak memory of every stage
+    :return: benchmark result of the program
+    """
+
+    lines = source.count("\n")
+
+    # best time out of all repeats
+    seconds = dict()
+    for _ in range(args.repeat):
+        for stage, elapsed in run_stages(name, source, args, path).items():
+            seconds[stage] = min(elapsed, seconds.get(stage, math.inf))
+
+    memory = dict()
+    if not args.no_memory:
+        tracemalloc.start()
+        try:
+            memory = run_stages(name, source, args, path, trace=True)
+        finally:
+            tracemalloc.stop()
+
+    stages = dict()
+    for stage in STAGES:
+        stages[stage] = {
+            "seconds": seconds[stage],
+            "lines_per_second": lines / max(seconds[stage], 1e-9),
+        }
+        if stage in memory:
+            stages[stage]["peak_memory"] = memory[stage]
+
+    total = sum(seconds.values())
+    LOGGER.info(f"{name}: {lines} lines in {total:.3f} s ({lines / max(total, 1e-9):,.0f} lines/s)")
+    for stage, result in stages.items():
+        memory_text = f"{result['peak_memory'] / 1024 / 1024:9.2f} MB" if "peak_memory" in result else ""
+        LOGGER.debug(f"    {stage:<12} {result['seconds'] * 1000:10.2f} ms "
+                     f"{result['lines_per_second']:14,.0f} lines/s {memory_text}")
+    return {"lines": lines, "stages": stages}
+
+
+def find_superlinear(results: dict) -> list[str]:
+    """
+    Finds stages, whose time grows faster than the size of synthetic programs
+    :param results: program name -> benchmark result
+    :return: problem descriptions
+    """
+
+    synthetic = sorted((result for name, result in results.items() if name.startswith("synthetic")),
+                       key=lambda x: x["lines"])
+
+    problems = []
+    for stage in STAGES:
+        for smaller, larger in zip(synthetic, synthetic[1:]):
+            time_a = smaller["stages"][stage]["seconds"]
+            time_b = larger["stages"][stage]["seconds"]
+            if time_a < MIN_SECONDS or time_b < MIN_SECONDS:
+                continue
+            exponent = math.log(time_b / time_a) / math.log(larger["lines"] / smaller["lines"])
+            if exponent > MAX_EXPONENT:
+                problems.append(f"{stage}: time grows as n^{exponent:.2f} "
+                                f"from {smaller['lines']} to {larger['lines']} lines")
+    return problems
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Compares results against the baseline
+    :param results: program name -> benchmark result
+    :param baseline: stored baseline
+    :param tolerance: allowed relative slowdown or memory growth
+    :return: problem descriptions
+    """
+
+    problems = []
+    for name, result in results.items():
+        if name not in baseline["results"]:
+            continue
+        for stage, current in result["stages"].items():
+            previous = baseline["results"][name]["stages"].get(stage)
+            if previous is None:
+                continue
+
+            if current["seconds"] >= MIN_SECONDS and \
+                    current["lines_per_second"] < previous["lines_per_second"] * (1 - tolerance):
+                problems.append(f"{name} {stage}: {current['lines_per_second']:,.0f} lines/s, "
+                                f"baseline {previous['lines_per_second']:,.0f} lines/s")
+
+            if "peak_memory" in current and "peak_memory" in previous and \
+                    current["peak_memory"] > max(previous["peak_memory"], 1024 * 1024) * (1 + tolerance):
+                problems.append(f"{name} {stage}: {current['peak_memory']:,} bytes peak memory, "
+                                f"baseline {previous['peak_memory']:,} bytes")
+    return problems
+
+
+def parse_args() -> Namespace:
+    parser = ArgumentParser(
+        prog="QM Compiler benchmark",
+        description="Measures compilation throughput of every stage")
+    parser.add_argument("--sizes",
+                        help="line counts of synthetic programs",
+                        type=int,
+                        nargs="*",
+                        default=SYNTHETIC_SIZES)
+    parser.add_argument("--namespace",
+                        help="code namespace",
+                        choices=["QT", "QM"],
+                        default="QT")
+    parser.add_argument("-O",
+                        help="optimization level",
+                        dest="optimization",
+                        type=int,
+                        choices=range(4),
+                        default=0)
+    parser.add_argument("--repeat",
+                        help="amount of timed compilations of every program; the best time is kept",
+                        type=int,
+                        default=3)
+    parser.add_argument("--no-memory",
+                        help="skips peak memory measurement",
+                        action="store_true",
+                        default=False)
+    parser.add_argument("--baseline",
+                        help="baseline file",
+                        default=BASELINE_PATH)
+    parser.add_argument("--update-baseline",
+                        help="stores results as the new baseline",
+                        action="store_true",
+                        default=False)
+    parser.add_argument("--tolerance",
+                        help="allowed relative slowdown or memory growth against the baseline",
+                        type=float,
+                        default=0.5)
+    parser.add_argument("-v", "--verbose",
+                        help="shows every stage",
+                        action="store_true",
+                        default=False)
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    logging.basicConfig(style="{", format="{levelname}: {message}", level=logging.INFO)
+    LOGGER.setLevel(logging.DEBUG if args.verbose else logging.INFO)
+
+    results = dict()
+    for path in sorted(glob(TESTS_PATTERN)):
+        with open(path, "r", encoding="ascii") as file:
+            source = file.read()
+        name = os.path.splitext(os.path.basename(path))[0]
+        results[name] = benchmark(name, source, args, path)
+    for size in args.sizes:
+        name = f"synthetic_{size}"
+        results[name] = benchmark(name, make_synthetic(size), args)
+
+    settings = {"namespace": args.namespace, "optimization": args.optimization}
+    problems = find_superlinear(results)
+    if args.update_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump({"settings": settings, "results": results}, file, indent=2)
+        LOGGER.info(f"baseline written to '{args.baseline}'")
+    elif os.path.isfile(args.baseline):
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+        if baseline["settings"] != settings:
+            LOGGER.warning(f"baseline was measured with {baseline['settings']}, not compared")
+        else:
+            problems += compare(results, baseline, args.tolerance)
+
+    for problem in problems:
+        LOGGER.error(problem)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""
+Data memory allocation for variables
+"""
+
+
+import logging
+from source.classes import *
+from source.built_ins import *
+from source.cfg import ControlFlowGraph, Liveness, ACCUMULATOR
+
+
+LOGGER = logging.getLogger("allocator")
+
+
+class VariableAllocator:
+    """
+    Gives data memory addresses to variables.
+
+    Variables are given out in order of their first appearance.
+    Variables, which lifetimes never overlap, share the same address.
+    Lifetimes come from liveness analysis of every code block, so they are extended over loops.
+    At a subroutine call, only variables the subroutine may read before writing them become live.
+    Variables, that are live across a subroutine call, interfere with every variable,
+    that may be accessed by the subroutine or by subroutines it calls.
+    Variables, which address is taken, are never shared, as they may be accessed through pointers
+    """
+
+    def __init__(self, namespace: CodeNamespace):
+        self.namespace: CodeNamespace = namespace
+
+        self.variables: list[str] = list()  # in order of first appearance
+        self.pinned: set[str] = set()
+        self.interference: dict[str, set[str]] = dict()
+
+        self.addresses: dict[str, int] = dict()
+        self.high_water_mark: int = 0
+
+    def _collect(self, blocks: list[CodeBlock]) -> tuple[dict[str, set[str]], dict[str, set[str]]]:
+        """
+        Collects variables, pinned variables and the call graph
+        :return: variables accessed by every block, and subroutines called by every block
+        """
+
+        call = self.namespace.subr_operations.get("call")
+        storing = set(self.namespace.variable_making)
+
+        accessed = dict()
+        callees = dict()
+        for block in blocks:
+            accessed[block.name] = block_accessed = set()
+            callees[block.name] = block_callees = set()
+            for instruction in block.instructions:
+                value = instruction.value
+                if value.type is TagType.VARIABLE:
+                    if value.value not in self.interference:
+                        self.variables.append(value.value)
+                        self.interference[value.value] = set()
+                    block_accessed.add(value.value)
+
+                    # address is taken
+                    if not instruction.flag and instruction.opcode.value not in storing:
+                        self.pinned.add(value.value)
+                elif instruction.opcode.value == call and not instruction.flag and isinstance(value.value, str):
+                    block_callees.add(value.value)
+        return accessed, callees
+
+    @staticmethod
+    def _get_call_effects(accessed: dict[str, set[str]], callees: dict[str, set[str]]) -> dict[str, set[str]]:
+        """
+        Finds all variables, that may be accessed by a subroutine, or by subroutines it calls
+        """
+
+        effects = {name: set(variables) for name, variables in accessed.items()}
+        changed = True
+        while changed:
+            changed = False
+            for name, called in callees.items():
+                size = len(effects[name])
+                for callee in called:
+                    if callee in effects:
+                        effects[name] |= effects[callee]
+                changed |= len(effects[name]) != size
+        return effects
+
+    def _get_call_uses(self, blocks: list[CodeBlock], call_effects: dict[str, set[str]]) -> dict[str, set]:
+        """
+        Finds values, that may be read by a subroutine before it writes them, including reads of subroutines it calls.
+        Locals of the subroutine are left out, unless they are read before being written
+        """
+
+        cfgs = {block.name: ControlFlowGraph(block.tagged_instructions(), self.namespace)
+                for block in blocks if block.name}
+        uses = {name: set() for name in call_effects if name}
+
+        # uses of callees grow uses of their callers, until nothing changes
+        changed = True
+        while changed:
+            changed = False
+            for name, cfg in cfgs.items():
+                if not cfg.blocks:
+                    continue
+                liveness = Liveness(cfg, uses, set())
+                live_in = liveness.live_in(cfg.blocks[0])
+                live_in.discard(ACCUMULATOR)
+                if not live_in <= uses[name]:
+                    uses[name] |= live_in
+                    changed = True
+        return uses
+
+    def _interfere(self, variable: str, others):
+        for other in others:
+            if other != variable and other in self.interference:
+                self.interference[variable].add(other)
+                self.interference[other].add(variable)
+
+    def _build_interference(self, block: CodeBlock, call_effects: dict[str, set[str]],
+                            call_uses: dict[str, set], return_live: set | None):
+        """
+        Adds interference of variables within a code block
+        :param call_effects: subroutine name -> variables, that may be overwritten by the call
+        :param call_uses: subroutine name -> values, that are live at the start of the subroutine
+        :param return_live: values, that may be read after the code block returns
+        """
+
+        storing = set(self.namespace.variable_making)
+        cfg = ControlFlowGraph(block.tagged_instructions(), self.namespace)
+        liveness = Liveness(cfg, call_uses, return_live)
+
+        # indirect calls may call any subroutine
+        call = self.namespace.subr_operations.get("call")
+        any_effects = set().union(*call_effects.values())
+
+        for basic_block in cfg.blocks:
+            live = set(basic_block.live_out)
+            for idx in range(basic_block.end - 1, basic_block.start - 1, -1):
+                instruction = cfg.instructions[idx]
+                if isinstance(instruction, Tag):
+                    continue
+
+                # variable is defined while others are live
+                if instruction.opcode.value in storing and instruction.value.type is TagType.VARIABLE:
+                    self._interfere(instruction.value.value, live)
+
+                # variables live across the call may be overwritten by the callee
+                if instruction.opcode.value == call:
+                    callee = liveness.get_callee(instruction)
+                    for variable in call_effects[callee] if callee is not None else any_effects:
+                        self._interfere(variable, live)
+
+                liveness.transfer(instruction, live)
+
+    def allocate(self, blocks: list[CodeBlock]) -> dict[str, int]:
+        """
+        Gives addresses to all variables within code blocks
+        :param blocks: compiled code blocks; the main program block has empty name
+        :return: variable name -> address table
+        """
+
+        accessed, callees = self._collect(blocks)
+        call_effects = self._get_call_effects(accessed, callees)
+        call_uses = self._get_call_uses(blocks, call_effects)
+
+        # locals of a subroutine are dead after it returns, unless the subroutine
+        # reads them before writing them, and so keeps them between calls
+        names = {block.name for block in blocks if block.name}
+        exposed = set().union(*call_uses.values())
+        shared = {variable for variable in self.variables
+                  if ":" not in variable or variable.partition(":")[0] not in names or variable in exposed}
+
+        for block in blocks:
+            return_live = call_effects[block.name] & shared if block.name else None
+            self._build_interference(block, call_effects, call_uses, return_live)
+
+        # greedy coloring, in order of first appearance
+        taken = set()  # all addresses given out so far
+        exclusive = set()  # addresses of pinned variables
+        for variable in self.variables:
+            if variable in self.pinned:
+                unavailable = taken
+            else:
+                unavailable = exclusive | {
+                    self.addresses[other] for other in self.interference[variable] if other in self.addresses}
+            address = 0
+            while address in unavailable:
+                address += 1
+
+            self.addresses[variable] = address
+            taken.add(address)
+            if variable in self.pinned:
+                exclusive.add(address)
+
+        self.high_water_mark = max(taken) + 1 if taken else 0
+        if self.high_water_mark > self.namespace.max_int + 1:
+            raise CompilerMemoryError(f"Out of data memory. {self.high_water_mark} cells are needed, "
+                                      f"but only {self.namespace.max_int + 1} are available")
+
+        LOGGER.debug(f"{len(self.variables)} variables placed into {self.high_water_mark} data memory cells")
+        return self.addresses
@@ -4,20 +4,44 @@ Sticks all code together
 
 
 import os
+import sys
+import glob
 import logging
-from time import sleep
+from time import perf_counter, time_ns
+from dataclasses import dataclass
 from argparse import ArgumentParser, Namespace
+from concurrent.futures import ProcessPoolExecutor
 from source.classes import *
 from source.lexer import Lexer
-from source.file_io import dump
+from source.file_io import dump, load_debug_info, collect_inputs, get_output_path, BYTECODE_EXTENSION
+from source.debug_info import DebugInfo
 from source.parser import Parser
+from source.linker import Linker
 from source.compiler import Compiler
+from source.optimizer import PassManager
+from source.watcher import FileWatcher
+from source.emulator import Emulator
+from source.profiler import Profiler
+from source.cache import CompileCache, COMPILER_VERSION, make_key, hash_file
 from source.built_ins import NamespaceQMr11, NamespaceQT, CodeNamespace
 
 
 LOGGER = logging.getLogger()
 
 
+@dataclass
+class BatchResult:
+    """
+    Result of a single file compilation in batch mode
+    """
+
+    path: str
+    output: str
+    bytes_written: int = 0
+    elapsed: float = 0.0
+    error: str | None = None
+
+
 class Application:
     """
     Main application class
@@ -26,6 +50,17 @@ class Application:
     def __init__(self):
         self.args: Namespace | None = None
         self.code_namespace: CodeNamespace | None = None
+        self.cache: CompileCache | None = None
+        self.linker: Linker | None = None
+        self.dependencies: list[str] = list()
+        self.listing: bool = True
+        self.bytecode: Bytecode | None = None  # last compiled bytecode
+        self.compiler: Compiler | None = None  # last compiler, None if bytecode was served from cache
+        self.debug_info: DebugInfo | None = None  # debug information of the last program
+
+        # front-end results, that are reused between live compilations
+        self.symbols: dict[str, Tag] = dict()
+        self.line_cache: dict[str, tuple[Tag, ...]] | None = None
 
     def parse_args(self) -> None:
         """
@@ -37,52 +72,203 @@ class Application:
             description="Quantum Mini Compiler CLI")
 
         parser.add_argument("-i", "--input",
-                            help="input file",
+                            help="input file; multiple files, directories or glob patterns enable batch mode",
+                            nargs="+",
                             required=True)
         parser.add_argument("-o", "--output",
-                            help="compiled bytecode output")
+                            help="compiled bytecode output; in batch mode outputs are written next to inputs")
+        parser.add_argument("-j", "--jobs",
+                            help="amount of parallel processes in batch mode",
+                            type=int,
+                            default=os.cpu_count())
         parser.add_argument("-v", "--verbose",
                             help="verbose output",
                             action="store_true",
                             default=False)
+        parser.add_argument("-O",
+                            help="optimization level",
+                            dest="optimization",
+                            type=int,
+                            choices=range(4),
+                            default=0)
+        parser.add_argument("--inline-budget",
+                            help="maximal size of subroutine, that is inlined at every call site at -O3",
+                            type=int,
+                            default=16)
         parser.add_argument("--namespace",
                             help="code namespace",
                             choices=["QT", "QM"],
                             default="QT")
+        parser.add_argument("--cache",
+                            help="compilation cache directory")
+        parser.add_argument("--cache-size",
+                            help="compilation cache size limit in megabytes",
+                            type=int,
+                            default=64)
         parser.add_argument("--live",
-                            help="compiles the file every 250 ms",
+                            help="recompiles the file every time it changes",
+                            action="store_true",
+                            default=False)
+        parser.add_argument("--debug-info",
+                            help="writes source lines and symbol addresses next to the output file",
+                            action="store_true",
+                            default=False)
+        parser.add_argument("--run",
+                            help="runs compiled program in the built-in emulator; "
+                                 f"'{BYTECODE_EXTENSION}' input files are run without compilation",
+                            action="store_true",
+                            default=False)
+        parser.add_argument("--max-steps",
+                            help="maximal amount of instructions executed by the emulator",
+                            type=int,
+                            default=10_000_000)
+        parser.add_argument("--profile",
+                            help="runs compiled program, and shows source lines it spends the most cycles on",
                             action="store_true",
                             default=False)
+        parser.add_argument("--flamegraph",
+                            help="collapsed stack output of the profiler, for flamegraph tools")
 
         self.args = parser.parse_args()
+        if self.args.profile or self.args.flamegraph:
+            self.args.profile = self.args.run = True
 
-    def compile_input(self):
+        # batch mode
+        self.args.batch = len(self.args.input) > 1 or any(
+            os.path.isdir(path) or glob.has_magic(path) for path in self.args.input)
+        if self.args.batch:
+            if self.args.output:
+                parser.error("argument -o/--output is not allowed in batch mode")
+            if self.args.live:
+                parser.error("argument --live is not allowed in batch mode")
+            if self.args.run:
+                parser.error("argument --run is not allowed in batch mode")
+        else:
+            self.args.input = self.args.input[0]
+
+    def parse_input(self) -> Scope:
         """
-        Compiles file
+        Lexes and parses input file
+        :return: parsed scope
         """
 
-        # read file
-        with open(self.args.input, "r", encoding="ascii") as file:
-            code = file.read()
-
-        # Lexing stage
+        # Lexing stage, file is read line by line
         lexer = Lexer()
         lexer.code_namespace = self.code_namespace
-        lexer.import_code(code)
-        lexer.evaluate()
+        lexer.symbols = self.symbols
+        lexer.line_cache = self.line_cache
+        with open(self.args.input, "r", encoding="ascii") as file:
+            lexer.import_code(file)
+            lexer.evaluate()
+        self.line_cache = lexer.line_cache
 
         # Parsing stage
         parser = Parser()
         parser.import_scope(lexer.current_scope)
         parser.parse()
+        return parser.current_scope
+
+    def compile_input(self) -> int:
+        """
+        Compiles file
+        :return: amount of bytes that were written
+        """
+
+        start_time = perf_counter()
+
+        # check compilation cache
+        scope = None
+        if self.cache is not None:
+            # includes are resolved relative to the input, so equal files in other directories may differ
+            source_key = make_key(COMPILER_VERSION, self.args.namespace, os.path.abspath(self.args.input),
+                                  hash_file(self.args.input))
+            dependencies = self.cache.get_dependencies(source_key)
+            bytecode_key = self._get_bytecode_key(source_key, dependencies)
+            bytecode = None
+            # debug information is only made by the compiler
+            if bytecode_key and not self.args.profile and not self.args.debug_info:
+                bytecode = self.cache.get_bytecode(bytecode_key, self.code_namespace)
+            if bytecode is not None:
+                LOGGER.debug(f"bytecode served from cache in {(perf_counter() - start_time) * 1000:.1f} ms")
+                self.dependencies = dependencies
+                self.compiler = None
+                self.debug_info = None
+                return self.write_output(bytecode)
+            scope = self.cache.get_scope(source_key)
+
+        # Lexing and parsing stages
+        if scope is None:
+            scope = self.parse_input()
+            if self.cache is not None:
+                self.cache.put_scope(source_key, scope)
 
         # Compilation stage
         compiler = Compiler()
         compiler.code_namespace = self.code_namespace
-        compiler.import_scope(parser.current_scope)
+        compiler.source_path = self.args.input
+        compiler.linker = self.linker if self.linker is not None else Linker(self.code_namespace)
+        compiler.optimizer = PassManager(self.code_namespace, self.args.optimization)
+        compiler.inline_budget = self.args.inline_budget
+        compiler.import_scope(scope)
         compiler.compile()
+        compiler.optimizer.report()
+        self.dependencies = compiler.dependencies
+        self.compiler = compiler
+        self.debug_info = None
+        if self.args.profile or self.args.debug_info:
+            self.debug_info = DebugInfo.from_compiler(compiler)
+
+        if self.cache is not None:
+            self.cache.put_dependencies(source_key, compiler.dependencies)
+            bytecode_key = self._get_bytecode_key(source_key, compiler.dependencies)
+            if bytecode_key:
+                self.cache.put_bytecode(bytecode_key, compiler.bytecode)
+
+        LOGGER.debug(f"compiled in {(perf_counter() - start_time) * 1000:.1f} ms")
+
+        return self.write_output(compiler.bytecode)
+
+    def _get_bytecode_key(self, source_key: str, dependencies: list[str] | None) -> str | None:
+        """
+        Makes bytecode cache key out of source key, optimization options and included file contents
+        :return: cache key, or None if included files are unknown or unreadable
+        """
+
+        if dependencies is None:
+            return None
+        try:
+            dependency_hashes = [hash_file(path) for path in dependencies]
+        except OSError:
+            return None
+        return make_key(source_key, "bytecode", f"O{self.args.optimization}",
+                        f"inline{self.args.inline_budget}", *dependency_hashes)
+
+    def write_output(self, bytecode: Bytecode) -> int:
+        """
+        Prints bytecode listing, and dumps it to output file
+        :return: amount of bytes that were written
+        """
+
+        self.bytecode = bytecode
+        if self.listing:
+            self.print_listing(bytecode)
 
-        for idx, instruction in enumerate(compiler.bytecode):
+        # check output argument, and dump to file
+        bytes_written = 0
+        if self.args.output:
+            debug_info = self.debug_info if self.args.debug_info else None
+            bytes_written = dump(bytecode, self.args.output, self.code_namespace, debug_info)
+            if self.listing:
+                LOGGER.info(f"{bytes_written} bytes written to '{self.args.output}'")
+        return bytes_written
+
+    def print_listing(self, bytecode: Bytecode):
+        """
+        Prints bytecode listing
+        """
+
+        opcode_names = {definition.opcode: name for name, definition in self.code_namespace.definitions.items()}
+        for idx, instruction in enumerate(bytecode):
             # line index
             output = f"{idx:04X}    "
 
@@ -93,7 +279,7 @@ class Application:
                 output += f"{'1' if instruction.flag else '0'} {instruction.value:02X} {instruction.opcode:02X}    "
 
             # instruction name
-            output += f"{compiler.instructions[idx].opcode.value: <8}"
+            output += f"{opcode_names[instruction.opcode]: <8}"
 
             # instruction value
             if instruction.value or instruction.flag:  # if value is above zero, or it's a memory address
@@ -103,10 +289,105 @@ class Application:
                     output += f"0x{instruction.value:02X}   # {instruction.value}"
             LOGGER.info(output)
 
-        # check output argument, and dump to file
-        if self.args.output:
-            bytes_written = dump(compiler.bytecode, self.args.output, self.code_namespace)
-            LOGGER.info(f"{bytes_written} bytes written to '{self.args.output}'")
+    def run_program(self, emulator: Emulator):
+        """
+        Runs program in the emulator, and logs the result.
+        When profiling, logs hot spots, and writes collapsed stacks
+        """
+
+        profiler = None
+        debug_info = self.debug_info
+        if self.args.profile:
+            profiler = Profiler(emulator,
+                                debug_info.lines if debug_info is not None else None,
+                                debug_info.origins if debug_info is not None else None,
+                                debug_info.symbols if debug_info is not None else None,
+                                debug_info.files if debug_info is not None else None)
+
+        start_time = perf_counter()
+        try:
+            if profiler is not None:
+                profiler.run(self.args.max_steps)
+            else:
+                emulator.run(self.args.max_steps)
+        except EmulatorError as err:
+            LOGGER.error(f"Error {err} at address: 0x{err.line:04X}")
+        elapsed = perf_counter() - start_time
+        LOGGER.info(f"{emulator.steps} instructions executed in {elapsed:.2f} s "
+                    f"({emulator.steps / max(elapsed, 1e-9) / 1e6:.2f} M/s)")
+
+        if not emulator.halted:
+            LOGGER.info(f"stopped at 0x{emulator.pc:04X}")
+        LOGGER.info(f"ACC: {emulator.acc}, PR: {emulator.pr}, flags: {emulator.flags:04b}, "
+                    f"stack: {emulator.stack}, ports: {emulator.ports}")
+        if emulator.output:
+            LOGGER.info(f"output: {emulator.output}")
+
+        if profiler is None:
+            return
+        # main and included source files
+        sources = dict()
+        for path in set(profiler.files):
+            try:
+                with open(path, "r", encoding="ascii") as file:
+                    sources[path] = file.readlines()
+            except (OSError, UnicodeDecodeError):
+                continue
+        profiler.report(sources)
+        if self.args.flamegraph:
+            name = os.path.splitext(os.path.basename(self.args.input))[0]
+            stacks = profiler.write_collapsed(self.args.flamegraph, name)
+            LOGGER.info(f"{stacks} stacks written to '{self.args.flamegraph}'")
+
+    def setup(self) -> None:
+        """
+        Sets up code namespace and compilation cache from arguments
+        """
+
+        # used namespace
+        match self.args.namespace:
+            case "QM":
+                self.code_namespace = NamespaceQMr11()
+            case _:
+                self.code_namespace = NamespaceQT()
+
+        # persistent compilation cache
+        if self.args.cache:
+            self.cache = CompileCache(self.args.cache, self.args.cache_size * 1024 * 1024)
+
+    def compile_batch(self) -> bool:
+        """
+        Compiles many input files in parallel processes.
+        Outputs are written next to the inputs
+        :return: True if all files were compiled successfully
+        """
+
+        paths = collect_inputs(self.args.input)
+        if not paths:
+            LOGGER.error("No input files found")
+            return False
+
+        start_time = perf_counter()
+        jobs = max(1, min(self.args.jobs or 1, len(paths)))
+        if jobs == 1:
+            _init_batch_worker(self.args)
+            results = list(map(_compile_batch_file, paths))
+        else:
+            with ProcessPoolExecutor(jobs, initializer=_init_batch_worker, initargs=(self.args,)) as executor:
+                results = list(executor.map(_compile_batch_file, paths))
+        elapsed = perf_counter() - start_time
+
+        # summary
+        for result in results:
+            if result.error is None:
+                LOGGER.info(f"OK     {result.elapsed * 1000:8.1f} ms {result.bytes_written:8} B  {result.path}")
+            else:
+                LOGGER.error(f"FAILED {result.elapsed * 1000:8.1f} ms {'':10}  {result.path}: {result.error}")
+        failed = sum(1 for result in results if result.error is not None)
+        LOGGER.info(f"{len(results) - failed} compiled, {failed} failed, "
+                    f"{sum(result.bytes_written for result in results)} bytes written "
+                    f"in {elapsed:.2f} s using {jobs} processes")
+        return failed == 0
 
     def run(self) -> None:
         """
@@ -123,30 +404,98 @@ class Application:
         else:
             logging.basicConfig(**kwargs, level=logging.INFO)
 
-        # used namespace
-        match self.args.namespace:
-            case "QM":
-                self.code_namespace = NamespaceQMr11()
-            case _:
-                self.code_namespace = NamespaceQT()
+        self.setup()
+
+        # batch compilation
+        if self.args.batch:
+            if not self.compile_batch():
+                sys.exit(1)
+            return
+
+        # run bytecode file without compilation
+        if self.args.run and self.args.input.endswith(BYTECODE_EXTENSION):
+            self.compiler = None
+            try:
+                emulator = Emulator.from_file(self.args.input)
+                self.debug_info = load_debug_info(self.args.input) if self.args.profile else None
+            except (CompilerError, OSError) as err:
+                LOGGER.error(f"Error {err}")
+                return
+            self.run_program(emulator)
+            return
+
+        # reuse front-end results between live compilations
+        watcher = None
+        if self.args.live:
+            self.line_cache = dict()
+            watcher = FileWatcher([self.args.input])
 
         # compile
         while True:
-            # clear screen
-            if os.name == "nt":  # windows
-                os.system("cls")
-            else:  # unix
-                os.system("clear")
+            self.clear_screen()
 
-            # compile input
+            # compile input; files are read after this point
+            compile_start = time_ns()
             try:
                 self.compile_input()
             except CompilerError as err:
                 LOGGER.error(f"Error {err} on line: {err.line}")
+            else:
+                if self.args.run:
+                    self.run_program(Emulator(self.code_namespace, self.bytecode))
 
             # if live updates are turned off -> break
-            if not self.args.live:
+            if watcher is None:
                 break
 
-            # wait
-            sleep(0.25)
+            # wait for changes in input or included files;
+            # included files, that were changed during the compilation, trigger a new one right away
+            watcher.watch([self.args.input, *self.dependencies], since=compile_start)
+            watcher.wait()
+
+    @staticmethod
+    def clear_screen() -> None:
+        """
+        Clears terminal screen using escape sequences
+        """
+
+        sys.stdout.write("\033[H\033[2J\033[3J")
+        sys.stdout.flush()
+
+
+# application of the batch worker process
+_batch_application: Application | None = None
+
+
+def _init_batch_worker(args: Namespace) -> None:
+    """
+    Initializes batch worker process.
+    Included files are shared between all files compiled by the worker
+    """
+
+    global _batch_application
+    _batch_application = Application()
+    _batch_application.args = Namespace(**vars(args))
+    _batch_application.listing = False
+    _batch_application.setup()
+    _batch_application.linker = Linker(_batch_application.code_namespace)
+
+
+def _compile_batch_file(path: str) -> BatchResult:
+    """
+    Compiles a single file in batch worker process
+    """
+
+    result = BatchResult(path, get_output_path(path))
+    _batch_application.args.input = path
+    _batch_application.args.output = result.output
+
+    start_time = perf_counter()
+    try:
+        result.bytes_written = _batch_application.compile_input()
+    except CompilerError as err:
+        result.error = f"{err} on line: {err.line}"
+    except (OSError, UnicodeDecodeError) as err:
+        result.error = str(err)
+    result.elapsed = perf_counter() - start_time
+    return result
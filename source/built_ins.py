@@ -36,6 +36,26 @@ class CodeNamespace(DefineNamespace):
     stack_operations: dict[str, str]
     subr_operations: dict[str, str]
     non_modifying_operations: set[str]
+    memory_modifying_operations: set[str]
+    control_flow_operations: set[str]
+
+    # tables for arithmetic optimizations; empty if there are none for the cpu
+    strength_reductions: dict[str, tuple[str, str]] = dict()
+    folding_operations: dict[str, int] = dict()
+    flag_reading_operations: set[str] = set()
+    flag_setting_operations: set[str] = set()
+
+    # tables for control and data flow analysis; empty if control flow of the cpu isn't described
+    jump_operations: dict[str, str] = dict()
+    halting_operations: set[str] = set()
+    pointer_register_operations: dict[str, str] = dict()
+    memory_reading_operations: set[str] = set()
+    accumulator_writing_operations: set[str] = set()
+    accumulator_ignoring_operations: set[str] = set()
+
+    # estimated cycle costs for profiling; instructions, that aren't listed, take a single cycle
+    instruction_cycles: dict[str, int] = dict()
+    memory_operand_cycles: int = 0  # extra cycles, when operand is read from data memory
 
 
 class NamespaceGeneral(DefineNamespace):
@@ -131,8 +151,49 @@ class NamespaceQMr11(CodeNamespace):
         "return": "RET"
     }
     non_modifying_operations: set[str] = {
-        # TODO: add non_modifying_operations for QM
+        "NOP",
+        "SRA",
+        "LRP",
+        "CRP",
+        "CCF",
+        "PUSH",
+        "UO",
+        "UOC",
+        "UOCR",
+        "PRW",
+        "INT",
+        "HALT"
+    }
+    memory_modifying_operations: set[str] = {
+        "INT"
+    }
+    control_flow_operations: set[str] = {
+        "CALL",
+        "RET",
+        "JMP",
+        "JMPP",
+        "JMPZ",
+        "JMPN",
+        "JMPC",
+        "INT",
+        "HALT"
+    }
+
+    instruction_cycles: dict[str, int] = {
+        "CALL": 2,
+        "RET": 2,
+        "JMP": 2,
+        "JMPP": 2,
+        "JMPZ": 2,
+        "JMPN": 2,
+        "JMPC": 2,
+        "MUL": 4,
+        "MULH": 4,
+        "DIV": 8,
+        "MOD": 8,
+        "INT": 4,
     }
+    memory_operand_cycles: int = 1
 
 
 class NamespaceQT(CodeNamespace):
@@ -205,3 +266,101 @@ class NamespaceQT(CodeNamespace):
         "int",
         "halt"
     }
+    memory_modifying_operations: set[str] = {
+        "int"
+    }
+    control_flow_operations: set[str] = {
+        "call",
+        "return",
+        "jump",
+        "jumpc",
+        "int",
+        "halt"
+    }
+
+    # operation with power of two immediate -> cheaper operation, and how its immediate is made
+    strength_reductions: dict[str, tuple[str, str]] = {
+        "mul": ("lsl", "shift"),
+        "div": ("lsr", "shift"),
+        "mod": ("and", "mask"),
+    }
+    # immediate operations, that can be folded together -> sign of immediate
+    folding_operations: dict[str, int] = {
+        "add": 1,
+        "sub": -1,
+    }
+    flag_reading_operations: set[str] = {
+        "jumpc",
+        "addc",
+        "subc",
+    }
+    flag_setting_operations: set[str] = {
+        "clf",
+        "and",
+        "or",
+        "xor",
+        "lsl",
+        "lsr",
+        "rol",
+        "ror",
+        "comp",
+        "add",
+        "sub",
+        "addc",
+        "subc",
+        "inc",
+        "dec",
+        "mul",
+        "div",
+        "mod",
+    }
+
+    # jump operation -> kind of jump (kinds are described in 'source.cfg')
+    jump_operations: dict[str, str] = {
+        "jump": "direct",
+        "jumpc": "pointer_conditional",
+    }
+    halting_operations: set[str] = {
+        "halt"
+    }
+    pointer_register_operations: dict[str, str] = {
+        "load": "loadpr",
+        "transfer": "tapr",
+    }
+    # operations, that read memory through the pointer register
+    memory_reading_operations: set[str] = {
+        "loadp"
+    }
+    # operations, that overwrite the accumulator without reading it
+    accumulator_writing_operations: set[str] = {
+        "load",
+        "loadp",
+        "pop",
+    }
+    # operations, that neither read nor write the accumulator
+    accumulator_ignoring_operations: set[str] = {
+        "nop",
+        "loadpr",
+        "jump",
+        "jumpc",
+        "clf",
+        "halt",
+    }
+
+    instruction_cycles: dict[str, int] = {
+        "loadp": 2,
+        "storep": 2,
+        "push": 2,
+        "pop": 2,
+        "call": 3,
+        "return": 3,
+        "jump": 2,
+        "jumpc": 2,
+        "mul": 4,
+        "div": 8,
+        "mod": 8,
+        "portw": 2,
+        "portr": 2,
+        "int": 4,
+    }
+    memory_operand_cycles: int = 1
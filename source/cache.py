@@ -0,0 +1,257 @@
+"""
+Content-addressed on-disk compilation cache
+"""
+
+
+import os
+import json
+import logging
+from hashlib import sha256
+from source.classes import *
+from source.built_ins import *
+
+
+LOGGER = logging.getLogger("cache")
+
+
+def _hash_compiler_sources() -> str:
+    """
+    Hashes source code of the compiler itself,
+    so any change to the compiler invalidates previously cached results
+    """
+
+    digest = sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(".py"):
+            with open(os.path.join(directory, filename), "rb") as file:
+                digest.update(filename.encode("utf-8") + b'\x00' + file.read())
+    return digest.hexdigest()
+
+
+COMPILER_VERSION: str = _hash_compiler_sources()
+
+SCOPE_TYPES: dict[str, type[Scope]] = {
+    "scope": Scope,
+    "global": GlobalScope,
+    "macro": MacroScope,
+    "subr": SubroutineScope,
+}
+SCOPE_NAMES: dict[type[Scope], str] = {value: key for key, value in SCOPE_TYPES.items()}
+
+
+def hash_file(path: str) -> str:
+    """
+    Hashes file contents, reading it in chunks
+    :param path: file path
+    :return: hex digest
+    """
+
+    digest = sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(1 << 16):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_key(*parts: str) -> str:
+    """
+    Makes cache key out of string parts
+    """
+
+    return sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+
+def serialize_scope(scope: Scope) -> bytes:
+    """
+    Serializes parsed scope tree.
+    Tags are stored once in a symbol table, and words refer to them by index
+    """
+
+    symbols: list[list[str]] = list()
+    symbol_ids: dict[tuple[str, str], int] = dict()
+
+    def encode(scope_: Scope) -> dict:
+        words = []
+        for word in scope_:
+            if isinstance(word, Scope):
+                words.append(encode(word))
+                continue
+            encoded = [word.line]
+            for tag in word:
+                key = (tag.value, tag.type.value)
+                if key not in symbol_ids:
+                    symbol_ids[key] = len(symbols)
+                    symbols.append(list(key))
+                encoded.append(symbol_ids[key])
+            words.append(encoded)
+        return {"type": SCOPE_NAMES[type(scope_)], "words": words}
+
+    tree = encode(scope)
+    return json.dumps({"symbols": symbols, "tree": tree}, separators=(",", ":")).encode("utf-8")
+
+
+def deserialize_scope(data: bytes) -> Scope:
+    """
+    Deserializes parsed scope tree, made by 'serialize_scope'
+    """
+
+    document = json.loads(data)
+    symbols = [Tag(value, TagType(type_)) for value, type_ in document["symbols"]]
+
+    def decode(encoded: dict) -> Scope:
+        scope = SCOPE_TYPES[encoded["type"]]()
+        for word in encoded["words"]:
+            if isinstance(word, dict):
+                scope.add(decode(word))
+            else:
+                scope.add(Word([symbols[idx] for idx in word[1:]], word[0]))
+        return scope
+
+    return decode(document["tree"])
+
+
+class CompileCache:
+    """
+    Persistent compilation cache.
+    Stores final bytecode and parsed scope trees, keyed by content hashes.
+    Bytecode keys also include content hashes of all included files.
+    Least recently used entries are evicted when cache exceeds its size limit.
+    Size of the cache is tracked as entries are written, and the directory is only scanned
+    once at the first write, and again when the tracked size crosses the limit
+    """
+
+    def __init__(self, directory: str, max_size: int = 64 * 1024 * 1024):
+        self.directory: str = directory
+        self.max_size: int = max_size
+        self.size: int | None = None  # tracked size of all entries; None until the directory is scanned
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _get_path(self, key: str, kind: str) -> str:
+        return os.path.join(self.directory, f"{key}.{kind}")
+
+    def _read(self, key: str, kind: str) -> bytes | None:
+        """
+        Reads cache entry, and marks it as recently used
+        """
+
+        path = self._get_path(key, kind)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def _write(self, key: str, kind: str, data: bytes):
+        """
+        Atomically writes cache entry, and evicts old entries if needed
+        """
+
+        if self.size is None:
+            self.evict()
+
+        path = self._get_path(key, kind)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            old_size = os.stat(path).st_size
+        except OSError:
+            old_size = 0
+        try:
+            with open(temp_path, "wb") as file:
+                file.write(data)
+            os.replace(temp_path, path)
+        except OSError as err:
+            LOGGER.warning(f"Unable to write cache entry: {err}")
+            return
+
+        self.size += len(data) - old_size
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """
+        Removes least recently used entries, until cache fits into its size limit.
+        Scans the whole directory, so entries written by other processes are counted too
+        """
+
+        entries = []
+        total_size = 0
+        with os.scandir(self.directory) as iterator:
+            for entry in iterator:
+                if not entry.is_file() or entry.name.endswith(".tmp"):
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                total_size += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
+        self.size = total_size
+
+    def get_bytecode(self, key: str, namespace: CodeNamespace) -> Bytecode | None:
+        """
+        Returns cached bytecode, or None if it's missing
+        """
+
+        data = self._read(key, "bin")
+        if data is None or len(data) % namespace.instruction_class.record.size:
+            return None
+        return Bytecode(namespace.instruction_class, bytearray(data))
+
+    def put_bytecode(self, key: str, bytecode: Bytecode):
+        """
+        Stores bytecode in cache
+        """
+
+        self._write(key, "bin", bytes(bytecode))
+
+    def get_scope(self, key: str) -> Scope | None:
+        """
+        Returns cached parsed scope tree, or None if it's missing
+        """
+
+        data = self._read(key, "scope")
+        if data is None:
+            return None
+        try:
+            return deserialize_scope(data)
+        except (ValueError, KeyError, IndexError, TypeError):
+            LOGGER.warning(f"Corrupted cache entry '{key}'")
+            return None
+
+    def put_scope(self, key: str, scope: Scope):
+        """
+        Stores parsed scope tree in cache
+        """
+
+        self._write(key, "scope", serialize_scope(scope))
+
+    def get_dependencies(self, key: str) -> list[str] | None:
+        """
+        Returns cached list of files, that source file depends on, or None if it's missing
+        """
+
+        data = self._read(key, "deps")
+        if data is None:
+            return None
+        try:
+            return list(json.loads(data))
+        except ValueError:
+            LOGGER.warning(f"Corrupted cache entry '{key}'")
+            return None
+
+    def put_dependencies(self, key: str, dependencies: list[str]):
+        """
+        Stores list of files, that source file depends on
+        """
+
+        self._write(key, "deps", json.dumps(dependencies).encode("utf-8"))
@@ -0,0 +1,268 @@
+"""
+Control flow graph and liveness analysis of code blocks
+"""
+
+
+from source.classes import *
+from source.built_ins import *
+
+
+# liveness key of the accumulator; variable names are never empty
+ACCUMULATOR: str = ""
+
+# kinds of jumps, described by 'CodeNamespace.jump_operations'
+JUMP_KINDS: dict[str, tuple[bool, bool]] = {
+    # kind -> (target is in the pointer register, may fall through)
+    "direct": (False, False),
+    "conditional": (False, True),
+    "pointer": (True, False),
+    "pointer_conditional": (True, True),
+}
+
+
+def get_memory_key(tag: Tag) -> int | str | None:
+    """
+    Returns liveness key of a memory cell a tag refers to:
+    address for numeric addresses, name for variables, that weren't given an address yet,
+    and None for label and subroutine references
+    """
+
+    value = tag.value
+    if tag.type is TagType.VARIABLE:
+        return value
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return None
+
+
+class BasicBlock:
+    """
+    Straight-line run of instructions.
+    Control enters only at the start, and leaves only at the end
+    """
+
+    __slots__ = ("start", "end", "successors", "predecessors", "exits", "live_out")
+
+    def __init__(self, start: int, end: int):
+        self.start: int = start
+        self.end: int = end
+        self.successors: list[int] = list()
+        self.predecessors: list[int] = list()
+        self.exits: bool = False  # control may leave the code block to an unknown place
+        self.live_out: set = set()
+
+
+class ControlFlowGraph:
+    """
+    Control flow graph of a single code block.
+
+    Works on TaggedInstructions before label and subroutine references are resolved,
+    so only jumps to labels of the same code block are followed.
+    Jumps elsewhere, calls, returns and interrupts leave the code block
+    """
+
+    def __init__(self, instructions: list[TaggedInstruction | Tag], namespace: CodeNamespace):
+        self.instructions: list[TaggedInstruction | Tag] = instructions
+        self.namespace: CodeNamespace = namespace
+        self.blocks: list[BasicBlock] = list()
+        self.labels: dict[str, int] = dict()  # label -> basic block index
+
+        self._build()
+
+    def _build(self):
+        """
+        Splits instructions into basic blocks, and connects them
+        """
+
+        control_flow = self.namespace.control_flow_operations
+
+        # block starts at labels and after control flow instructions
+        start = 0
+        for idx, instruction in enumerate(self.instructions):
+            if isinstance(instruction, Tag):
+                if idx > start:
+                    self.blocks.append(BasicBlock(start, idx))
+                    start = idx
+                self.labels[instruction.value] = len(self.blocks)
+            elif instruction.opcode.value in control_flow:
+                self.blocks.append(BasicBlock(start, idx + 1))
+                start = idx + 1
+        if start < len(self.instructions) or not self.blocks:
+            self.blocks.append(BasicBlock(start, len(self.instructions)))
+
+        for block_idx, block in enumerate(self.blocks):
+            self._connect(block_idx, block)
+        for block_idx, block in enumerate(self.blocks):
+            for successor in block.successors:
+                self.blocks[successor].predecessors.append(block_idx)
+
+    def _connect(self, block_idx: int, block: BasicBlock):
+        """
+        Finds successors of a basic block
+        """
+
+        jumps = self.namespace.jump_operations
+        pointer_operations = self.namespace.pointer_register_operations
+
+        # track the label, that is loaded into the pointer register
+        pointer_target = None
+        last = None
+        for instruction in self.instructions[block.start:block.end]:
+            if isinstance(instruction, Tag):
+                continue
+            last = instruction
+            opcode = instruction.opcode.value
+            if opcode == pointer_operations.get("load"):
+                pointer_target = None if instruction.flag else instruction.value.value
+            elif opcode in pointer_operations.values():
+                pointer_target = None
+
+        # calls and interrupts return to the next instruction
+        falls_through = True
+        if last is not None:
+            opcode = last.opcode.value
+            if opcode in self.namespace.halting_operations:
+                falls_through = False
+            elif opcode == self.namespace.subr_operations.get("return"):
+                falls_through = False
+                block.exits = True
+            elif opcode in jumps:
+                uses_pointer, falls_through = JUMP_KINDS[jumps[opcode]]
+                if uses_pointer:
+                    self._add_target(block, pointer_target)
+                else:
+                    self._add_target(block, None if last.flag else last.value.value)
+
+        if falls_through:
+            if block_idx + 1 < len(self.blocks):
+                block.successors.append(block_idx + 1)
+            else:
+                block.exits = True
+
+    def _add_target(self, block: BasicBlock, target):
+        """
+        Adds jump target to block successors; unknown targets leave the code block
+        """
+
+        if isinstance(target, str) and target in self.labels:
+            block.successors.append(self.labels[target])
+        else:
+            block.exits = True
+
+
+class Liveness:
+    """
+    Backwards liveness analysis of memory cells and the accumulator over a control flow graph.
+
+    Everything is live where control leaves the code block, and at instructions,
+    which may read memory or the accumulator in an unknown way (calls, interrupts, pointer loads).
+    Nothing is live after halting instructions.
+    What is live at calls of known subroutines and at returns can be narrowed down
+    """
+
+    def __init__(self, cfg: ControlFlowGraph,
+                 call_effects: dict[str, set] | None = None,
+                 return_live: set | None = None):
+        """
+        :param cfg: control flow graph
+        :param call_effects: subroutine name -> memory cells, that may be accessed by the subroutine
+        :param return_live: memory cells, that are live after the code block returns
+        """
+
+        self.cfg: ControlFlowGraph = cfg
+        self.namespace: CodeNamespace = cfg.namespace
+        self.call_effects: dict[str, set] = call_effects if call_effects is not None else dict()
+
+        # all memory cells, that are accessed in the code block
+        self.universe: set = {ACCUMULATOR}
+        for instruction in cfg.instructions:
+            if not isinstance(instruction, Tag) and (key := get_memory_key(instruction.value)) is not None:
+                self.universe.add(key)
+        self.return_live: set = return_live | {ACCUMULATOR} if return_live is not None else self.universe
+
+        self._solve()
+
+    def get_callee(self, instruction: TaggedInstruction) -> str | None:
+        """
+        Returns name of the subroutine called by the instruction, if the subroutine is known
+        """
+
+        if (instruction.opcode.value == self.namespace.subr_operations.get("call") and not instruction.flag and
+                instruction.value.value in self.call_effects):
+            return instruction.value.value
+        return None
+
+    def transfer(self, instruction: TaggedInstruction, live: set):
+        """
+        Updates set of live values from after the instruction to before it
+        """
+
+        namespace = self.namespace
+        opcode = instruction.opcode.value
+
+        if opcode in namespace.halting_operations:
+            live.clear()
+            return
+        if opcode == namespace.subr_operations.get("return"):
+            live.clear()
+            live |= self.return_live
+            return
+        if opcode in namespace.control_flow_operations and opcode not in namespace.jump_operations:
+            callee = self.get_callee(instruction)
+            live |= self.call_effects[callee] if callee is not None else self.universe
+            live.add(ACCUMULATOR)
+            return
+        if opcode in namespace.memory_reading_operations:
+            live |= self.universe
+
+        key = get_memory_key(instruction.value)
+        if opcode in namespace.variable_making:
+            if key is not None:
+                live.discard(key)
+        elif instruction.flag and key is not None:
+            live.add(key)
+
+        if opcode in namespace.accumulator_writing_operations:
+            live.discard(ACCUMULATOR)
+        elif opcode not in namespace.accumulator_ignoring_operations:
+            live.add(ACCUMULATOR)
+
+    def live_in(self, block: BasicBlock) -> set:
+        """
+        Returns live values at the start of a basic block
+        """
+
+        live = set(block.live_out)
+        for idx in range(block.end - 1, block.start - 1, -1):
+            instruction = self.cfg.instructions[idx]
+            if not isinstance(instruction, Tag):
+                self.transfer(instruction, live)
+        return live
+
+    def _solve(self):
+        """
+        Computes live values at the end of every basic block, iterating until a fixed point
+        """
+
+        blocks = self.cfg.blocks
+        live_in = [set() for _ in blocks]
+        worklist = list(range(len(blocks)))
+        pending = set(worklist)
+        while worklist:
+            block_idx = worklist.pop()
+            pending.discard(block_idx)
+            block = blocks[block_idx]
+
+            block.live_out = set(self.universe) if block.exits else set()
+            for successor in block.successors:
+                block.live_out |= live_in[successor]
+
+            new_live_in = self.live_in(block)
+            if new_live_in != live_in[block_idx]:
+                live_in[block_idx] = new_live_in
+                for predecessor in block.predecessors:
+                    if predecessor not in pending:
+                        pending.add(predecessor)
+                        worklist.append(predecessor)
@@ -5,6 +5,7 @@ Compiler classes
 
 from typing import Any
 from enum import StrEnum
+from struct import Struct
 from dataclasses import dataclass, replace
 from source.exceptions import *
 
@@ -14,15 +15,17 @@ class TagType(StrEnum):
     INTERNAL = "internal"
     BUILT_IN = "built-in"
     POINTER = "pointer"
+    VARIABLE = "variable"  # variable, that wasn't given an address yet
 
     def __repr__(self):
         return self.value
 
 
-@dataclass
+@dataclass(slots=True)
 class Tag:
     """
-    TagType - value pair
+    TagType - value pair.
+    Tags may be shared between words, so they must not be modified in place
     """
 
     value: Any | None = None
@@ -34,12 +37,16 @@ class Word:
     Instruction word
     """
 
-    def __init__(self, tags: list[Tag] | None = None, line: int = -1):
+    __slots__ = ("tags", "line", "file")
+
+    def __init__(self, tags: list[Tag] | None = None, line: int = -1, file: str = ""):
         self.tags: list[Tag] = tags if tags is not None else list()
         self.line: int = line
+        self.file: str = file  # path of included file; empty for the main source file
 
     def __copy__(self):
-        return self.__class__([replace(tag) for tag in self.tags], self.line)
+        # tags are shared until they are replaced
+        return self.__class__(self.tags.copy(), self.line, self.file)
 
     def __iter__(self):
         return self.tags.__iter__()
@@ -78,6 +85,8 @@ class Scope:
     Scope of instruction words
     """
 
+    __slots__ = ("words",)
+
     def __init__(self, words: list | None = None):
         self.words: list[Word | Scope] = words if words is not None else list()
 
@@ -118,18 +127,87 @@ class MacroScope(Scope):
     Special type of scope used for macros
     """
 
+    __slots__ = ()
+
 
 class SubroutineScope(Scope):
     """
     Special type of scope used for subroutines
     """
 
+    __slots__ = ()
+
 
 class GlobalScope(Scope):
     """
     Global scope
     """
 
+    __slots__ = ()
+
+
+class MacroTemplate:
+    """
+    Macro, that is prepared for instantiation.
+    Positions of parameters within macro body are indexed at definition,
+    so every instance is made in a single pass over the body
+    """
+
+    __slots__ = ("header", "body", "slots")
+
+    def __init__(self, header: Word, body: Scope):
+        self.header: Word = header
+        self.body: Scope = body
+
+        # parameter value -> (parameter tag, parameter index)
+        parameters = {}
+        for index, tag in enumerate(header[3:]):
+            parameters.setdefault(tag.value, (tag, index))
+        self.slots: list = self._index_slots(body, parameters)
+
+    @classmethod
+    def _index_slots(cls, scope: Scope, parameters: dict[str, tuple[Tag, int]]) -> list:
+        """
+        Finds parameter positions for every word within scope
+        :return: list of (tag index, parameter index) lists, nested for nested scopes
+        """
+
+        slots = []
+        for word in scope:
+            if isinstance(word, Scope):
+                slots.append(cls._index_slots(word, parameters))
+                continue
+            word_slots = []
+            for tag_index, tag in enumerate(word):
+                parameter = parameters.get(tag.value)
+                if parameter is not None and parameter[0] == tag:
+                    word_slots.append((tag_index, parameter[1]))
+            slots.append(word_slots)
+        return slots
+
+    @classmethod
+    def _instantiate(cls, scope: Scope, slots: list, args: list[Tag]) -> Scope:
+        instance = scope.__class__()
+        for word, word_slots in zip(scope, slots):
+            if isinstance(word, Scope):
+                instance.words.append(cls._instantiate(word, word_slots, args))
+                continue
+            tags = word.tags.copy()
+            for tag_index, parameter_index in word_slots:
+                if parameter_index < len(args):
+                    tags[tag_index] = args[parameter_index]
+            instance.words.append(Word(tags, word.line, word.file))
+        return instance
+
+    def instantiate(self, args: list[Tag]) -> Scope:
+        """
+        Makes macro body instance with parameters replaced by arguments
+        :param args: argument tags
+        :return: macro body instance
+        """
+
+        return self._instantiate(self.body, self.slots, args)
+
 
 def recursive_scope_print(scope: Scope, level: int = 0):
     """
@@ -145,33 +223,81 @@ def recursive_scope_print(scope: Scope, level: int = 0):
 
 class TaggedInstruction:
     """
-    Like instruction, except it uses tags
+    Like instruction, except it uses tags.
+    Keeps source file and line, and origin - path of subroutine and macros the instruction was expanded from
     """
 
-    def __init__(self, flag: bool, value: Tag, opcode: Tag):
+    __slots__ = ("value", "opcode", "flag", "line", "origin", "file")
+
+    def __init__(self, flag: bool, value: Tag, opcode: Tag, line: int = -1, origin: str = "", file: str = ""):
         self.value: Tag = value
         self.opcode: Tag = opcode
         self.flag: bool = flag
+        self.line: int = line
+        self.origin: str = origin
+        self.file: str = file  # path of included file; empty for the main source file
 
     def __repr__(self):
         return f"{'1' if self.flag else '0'} {self.value.__repr__(): <32} {self.opcode.__repr__(): <32}"
 
 
+class CodeBlock:
+    """
+    Relocatable block of TaggedInstructions.
+    Label addresses are relative to the start of the block,
+    and references to labels or subroutines are patched during layout
+    """
+
+    __slots__ = ("name", "instructions", "labels", "fixups")
+
+    def __init__(self, name: str, instructions: list[TaggedInstruction] | None = None):
+        self.name: str = name
+        self.instructions: list[TaggedInstruction] = instructions if instructions is not None else list()
+        self.labels: dict[str, int] = dict()
+        self.fixups: list[tuple[int, str]] = list()
+
+    def __len__(self):
+        return len(self.instructions)
+
+    def tagged_instructions(self) -> list[TaggedInstruction | Tag]:
+        """
+        Returns block instructions with address pointer Tags put back in place of labels
+        """
+
+        labels = dict()
+        for name, offset in self.labels.items():
+            labels.setdefault(offset, []).append(Tag(name, TagType.POINTER))
+
+        instructions = []
+        for offset, instruction in enumerate(self.instructions):
+            instructions.extend(labels.get(offset, ()))
+            instructions.append(instruction)
+        instructions.extend(labels.get(len(self.instructions), ()))
+        return instructions
+
+
 class InstructionN:
     """
     Base class for Quantum architecture
     """
 
+    __slots__ = ("flag", "value", "opcode")
+
+    # binary record layout: flag, value, opcode
+    record: Struct = Struct(">BIB")
+    value_mask: int = 0xFFFF_FFFF
+    opcode_mask: int = 0xFF
+
     def __init__(self, flag: bool, value: int, opcode: int):
-        self.flag: bool = flag
-        self.value: int = value
-        self.opcode: int = opcode
+        self.flag: bool = bool(flag)
+        self.value: int = value & self.value_mask
+        self.opcode: int = opcode & self.opcode_mask
 
     def __repr__(self):
         return f"{'1' if self.flag else '0'} {str(self.value): <3} {self.opcode: <3}"
 
     def __bytes__(self):
-        return self.flag.to_bytes(1) + self.value.to_bytes(4) + self.opcode.to_bytes(1)
+        return self.record.pack(self.flag, self.value, self.opcode)
 
 
 class Instruction16(InstructionN):
@@ -179,32 +305,80 @@ class Instruction16(InstructionN):
     16 bit instruction for MQ cpu's
     """
 
-    def __init__(self, flag: bool, value: int, opcode: int):
-        super().__init__(
-            flag,
-            value & 0b1111_1111,
-            opcode & 0b111_1111)
+    __slots__ = ()
+
+    record: Struct = Struct(">BBB")
+    value_mask: int = 0b1111_1111
+    opcode_mask: int = 0b111_1111
 
     def __repr__(self):
         return f"{'1' if self.flag else '0'} {bin(self.value)[2:]:0>8} {bin(self.opcode)[2:]:0>7}"
 
-    def __bytes__(self):
-        return self.flag.to_bytes(1) + self.value.to_bytes(1) + self.opcode.to_bytes(1)
-
 
 class Instruction24(InstructionN):
     """
     24 bit instruction for QT cpu's
     """
 
-    def __init__(self, flag: bool, value: int, opcode: int):
-        super().__init__(
-            flag,
-            value & 0b1111_1111_1111_1111,
-            opcode & 0b111_1111)
+    __slots__ = ()
+
+    record: Struct = Struct(">BHB")
+    value_mask: int = 0b1111_1111_1111_1111
+    opcode_mask: int = 0b111_1111
 
     def __repr__(self):
         return f"{'1' if self.flag else '0'} {bin(self.value)[2:]:0>16} {bin(self.opcode)[2:]:0>7}"
 
+
+class Bytecode:
+    """
+    Contiguous bytecode buffer.
+    Instructions are stored as fixed size records of the instruction class
+    """
+
+    __slots__ = ("instruction_class", "buffer")
+
+    def __init__(self, instruction_class: type[InstructionN] = InstructionN, buffer: bytearray | None = None):
+        self.instruction_class: type[InstructionN] = instruction_class
+        self.buffer: bytearray = buffer if buffer is not None else bytearray()
+
+    def __len__(self):
+        return len(self.buffer) // self.instruction_class.record.size
+
+    def __getitem__(self, item: int) -> InstructionN:
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("bytecode index out of range")
+        return self.instruction_class(*self.instruction_class.record.unpack_from(
+            self.buffer, item * self.instruction_class.record.size))
+
+    def __iter__(self):
+        for fields in self.instruction_class.record.iter_unpack(self.buffer):
+            yield self.instruction_class(*fields)
+
     def __bytes__(self):
-        return self.flag.to_bytes(1) + self.value.to_bytes(2) + self.opcode.to_bytes(1)
+        return bytes(self.buffer)
+
+    def view(self) -> memoryview:
+        """
+        Returns zero-copy view of the bytecode buffer
+        """
+
+        return memoryview(self.buffer)
+
+    def append(self, instruction: InstructionN):
+        """
+        Appends an instruction to the buffer
+        """
+
+        self.emit(instruction.flag, instruction.value, instruction.opcode)
+
+    def emit(self, flag: bool, value: int, opcode: int):
+        """
+        Appends a raw instruction record to the buffer
+        """
+
+        instruction_class = self.instruction_class
+        self.buffer += instruction_class.record.pack(
+            flag, value & instruction_class.value_mask, opcode & instruction_class.opcode_mask)
@@ -3,14 +3,25 @@ Compiling code
 """
 
 
+import os
 import logging
+from typing import Iterable
+from collections import deque, ChainMap
 from source.classes import *
 from source.built_ins import *
 from source.linker import Linker
+from source.optimizer import PassManager
+from source.inliner import SubroutineInliner
+from source.eliminator import DeadCodeEliminator
+from source.allocator import VariableAllocator
+from source.expression import evaluate
 
 
 LOGGER = logging.getLogger("compiler")
 
+# marks the end of macro instance words in the second stage worklist
+_END_OF_MACRO: Word = Word()
+
 
 class Compiler:
     """
@@ -22,14 +33,34 @@ class Compiler:
     def __init__(self):
         self.current_scope: Scope = Scope()
 
-        self.bytecode: list[InstructionN] = list()
+        self.source_path: str | None = None
+        self.linker: Linker | None = None
+        self.dependencies: list[str] = list()
+        self.optimizer: PassManager | None = None
+        self.inline_budget: int = 16
+        self.inlined: int = 0  # amount of inlined subroutine calls
+
+        self.bytecode: Bytecode = Bytecode()
         self.instructions: list[TaggedInstruction | Tag] = list()
+        self.blocks: list[CodeBlock] = list()
 
         self.pointers: dict[str, Tag] = dict()
         self.address_pointers: dict[str, Tag] = dict()
-        self.pointer_counter: int = -1
+        self.block_name: str = ""
+        self.origin: str = ""  # origin of instructions, that are being compiled
+
+        # per address source files, lines and origins, and addresses of subroutines and labels
+        self.files: list[str] = list()
+        self.lines: list[int] = list()
+        self.origins: list[str] = list()
+        self.symbols: dict[str, int] = dict()
+
+        # variable name -> data memory address, and amount of used data memory cells
+        self.variables: dict[str, int] = dict()
+        self.data_memory_size: int = 0
 
-        self.macros: dict[str, Scope] = dict()
+        self.defines: dict[str, tuple[Tag, Tag, int]] = dict()
+        self.macros: dict[str, MacroTemplate] = dict()
         self.subroutines: dict[str, Scope] = dict()
 
     def import_scope(self, scope: Scope):
@@ -47,24 +78,16 @@ class Compiler:
 
         self.pointers: dict[str, Tag] = kwargs.get("pointers", dict())
         self.address_pointers: dict[str, Tag] = kwargs.get("address_pointers", dict())
-        self.pointer_counter: int = kwargs.get("pointer_counter", -1)
 
-        self.macros: dict[str, Scope] = kwargs.get("macros", dict())
+        self.macros: dict[str, MacroTemplate] = kwargs.get("macros", dict())
         self.subroutines: dict[str, Scope] = kwargs.get("subroutines", dict())
 
-    def _generate_macro_scope(self, name: str, args: list[Tag]):
+    def _generate_macro_scope(self, name: str, args: list[Tag]) -> Scope:
         """
         Generates a formatted macro scope
         """
 
-        macro = self.macros[name].__copy__()
-
-        # macro with multiple args
-        if len(macro[0]) > 2:
-            # translation dictionary
-            for old, new in zip(macro[0][3:], args):
-                self._match_and_replace(macro[1], old, new)
-        return macro[1]
+        return self.macros[name].instantiate(args)
 
     def _generate_subr_scope(self, name: str):
         """
@@ -81,134 +104,209 @@ class Compiler:
                 subr[1].insert(0, Word([
                     Tag(self.code_namespace.variable_making[0], TagType.BUILT_IN),
                     arg
-                ]))
+                ], line=subr[0].line, file=subr[0].file))
                 # pop instruction
                 subr[1].insert(0, Word([
                     Tag(self.code_namespace.stack_operations["pop"], TagType.BUILT_IN),
-                ]))
+                ], line=subr[0].line, file=subr[0].file))
         return subr[1]
 
-    def _match_and_replace(self, scope: Scope, old: Tag, new: Tag):
+    def _resolve_define(self, tag: Tag) -> Tag:
         """
-        Match and replace all tags within scope from old to new
+        Resolves tag through the define symbol table.
+        Defines, that refer to other defines, are followed until the final value
+        :param tag: tag to resolve
+        :return: resolved tag, or the same tag if it wasn't defined
+        """
+
+        seen = set()
+        while (entry := self.defines.get(tag.value)) is not None and entry[0] == tag:
+            if tag.value in seen:
+                raise CompilerSyntaxError(f"Recursive define '{tag.value}'", line=entry[2])
+            seen.add(tag.value)
+            tag = entry[1]
+        return tag
+
+    def _get_define_value(self, name: str) -> str | None:
+        """
+        Returns value of a define, or None if it wasn't defined
+        """
+
+        tag = Tag(name, TagType.POINTER)
+        resolved = self._resolve_define(tag)
+        return None if resolved is tag else resolved.value
+
+    def _substitute_defines(self, scope: Scope, resolved: dict[str, Tag]):
+        """
+        Substitutes all defined tags within scope in a single pass
+        :param scope: scope to process
+        :param resolved: name -> resolved tag table
         """
 
         for word in scope:
             if isinstance(word, Word):
                 for idx, tag in enumerate(word):
-                    if tag == old:
-                        word[idx] = new
+                    new_tag = resolved.get(tag.value)
+                    if new_tag is not None and self.defines[tag.value][0] == tag:
+                        word[idx] = new_tag
             else:
-                self._match_and_replace(word, old, new)
+                self._substitute_defines(word, resolved)
 
-    @staticmethod
-    def _convert_tagged2byte(instruction: TaggedInstruction, namespace: CodeNamespace) -> InstructionN:
+    def _include(self, word: Word, path: str | None, include_stack: list[str]) -> list[Word | Scope]:
         """
-        Converts 'instruction' to bytecode restricted instruction
+        Includes a file, path of which is relative to the including file.
+        Every file is included at most once, later includes of the same file are skipped
+        :param word: include word
+        :param path: path of the including file
+        :param include_stack: paths of files, that are being included
+        :return: preprocessed words of the included file
         """
 
-        return namespace.instruction_class(
-            flag=instruction.flag,
-            value=int(instruction.value.value),  # make sure it's int
-            opcode=namespace.definitions[instruction.opcode.value].opcode)
-
-    def _preprocess_stage(self):
+        if len(word) != 2:
+            raise CompilerSyntaxError("Incorrect number of arguments", line=word.line)
+
+        # make path relative to the including file
+        base_directory = os.path.dirname(path) if path is not None else os.getcwd()
+        include_path = os.path.abspath(os.path.join(base_directory, word[1].value.strip("\"'<>")))
+        if include_path in include_stack:
+            cycle = " -> ".join(include_stack[include_stack.index(include_path):] + [include_path])
+            raise CompilerIncludeError(f"Include cycle {cycle}", line=word.line)
+
+        # already included through another file
+        if include_path in self.dependencies:
+            return []
+
+        if self.linker is None:
+            self.linker = Linker(self.code_namespace)
+        try:
+            scope = self.linker.load(include_path)
+        except (OSError, UnicodeDecodeError):
+            raise CompilerIncludeError(f"Unable to include '{include_path}'", line=word.line)
+        except CompilerError as err:
+            raise err.__class__(f"{err} in '{include_path}'", line=err.line)
+
+        self.dependencies.append(include_path)
+        return self._preprocess_words(scope, include_path, include_stack + [include_path])
+
+    def _preprocess_words(self, words: Iterable[Word | Scope], path: str | None,
+                          include_stack: list[str]) -> list[Word | Scope]:
         """
-        Preprocessor stage.
-
-        Processes all INTERNAL tag types
+        Collects defines and processes includes
+        :param words: words to preprocess
+        :param path: path of the file words are from
+        :param include_stack: paths of files, that are being included
+        :return: words without preprocessor instructions
         """
 
-        idx = -1
-        while idx < len(self.current_scope)-1:
-            idx += 1
-            word = self.current_scope[idx]
-
-            # skip all scopes
-            if isinstance(word, Scope):
+        remaining = []
+        for word in words:
+            # skip all scopes and all non internal tag types
+            if isinstance(word, Scope) or word[0].type is not TagType.INTERNAL:
+                remaining.append(word)
                 continue
 
-            # skip all non internal tag types
-            if word[0].type is not TagType.INTERNAL:
-                continue
-
-            # delete preprocessor instruction
-            word = self.current_scope.pop(idx)
-            idx -= 1
-
             instruction = word[0].value[1:]
             if instruction == "define":
                 old_tag = word[1]
 
                 # generic defines
                 if len(word) == 3:
-                    new_tag = word[2]
+                    new_tag = self._resolve_define(word[2])
 
                 # defines with more than 2 arguments
                 else:
-                    # try to evaluate the expression
+                    # try to evaluate the expression, using earlier defines
                     expression = " ".join(x.value for x in word[2:])
-                    expression = expression.replace("__", "")  # there is no good reason to use '__'
                     try:
-                        evaluated = int(eval(expression)) % (self.code_namespace.max_int + 1)
-                    except Exception as err:
+                        evaluated = evaluate(expression, self._get_define_value) % (self.code_namespace.max_int + 1)
+                    except CompilerError:
                         raise CompilerSyntaxError(f"Unable to process '{expression}'", line=word.line)
 
                     # generate new tag according to newly calculated value
                     new_tag = Tag(str(evaluated), TagType.POINTER)
 
-                self._match_and_replace(self.current_scope, old_tag, new_tag)
+                self.defines[old_tag.value] = (old_tag, new_tag, word.line)
 
             elif instruction == "include":
-                if len(word) != 2:
-                    raise CompilerSyntaxError("Incorrect number of arguments", line=word.line)
+                remaining.extend(self._include(word, path, include_stack))
 
-                linker = Linker(self.code_namespace)
-                # TODO: proper relative to source code paths
-                raise CompilerNotImplementedError(line=word.line)
+        return remaining
 
-    def _compile_first_stage(self):
+    def _preprocess_stage(self):
         """
-        First internal compilation stage.
+        Preprocessor stage.
 
-        Finds all subroutine and macros definitions
+        Processes all INTERNAL tag types.
+        Defines are collected into a symbol table first, and then substituted in one pass
         """
 
-        idx = -1
-        while idx < len(self.current_scope) - 1:
-            idx += 1
-            word = self.current_scope[idx]
+        include_stack = [os.path.abspath(self.source_path)] if self.source_path is not None else []
+        self.current_scope.words = self._preprocess_words(self.current_scope, self.source_path, include_stack)
+
+        # substitute all defines
+        if self.defines:
+            resolved = {name: self._resolve_define(old_tag) for name, (old_tag, _, _) in self.defines.items()}
+            self._substitute_defines(self.current_scope, resolved)
 
+    def _scan_definitions(self, words: Iterable[Word | Scope]) -> list[Word | Scope]:
+        """
+        Finds all subroutine, macro and address pointer definitions within words
+        :param words: words to scan
+        :return: words without macro and subroutine definitions
+        """
+
+        remaining = []
+        words = iter(words)
+        for word in words:
             # keywords
             if word[0].value == "macro":
-                self.macros[word[1].value] = MacroScope([
-                    self.current_scope.pop(idx),
-                    self.current_scope.pop(idx)])
-                idx -= 1
+                self.macros[word[1].value] = MacroTemplate(word, next(words))
             elif word[0].value == "subr":
-                self.subroutines[word[1].value] = SubroutineScope([
-                    self.current_scope.pop(idx),
-                    self.current_scope.pop(idx)])
+                self.subroutines[word[1].value] = SubroutineScope([word, next(words)])
                 self.subroutines[word[1].value][1] = self._generate_subr_scope(word[1].value)
-                idx -= 1
+            else:
+                # address pointer
+                if word[0].type is TagType.POINTER and word[0].value[0] == "@":
+                    self.address_pointers[word[0].value] = word[0]
+                remaining.append(word)
+        return remaining
 
-            # address pointer
-            elif word[0].type is TagType.POINTER and word[0].value[0] == "@":
-                self.address_pointers[word[0].value] = word[0]
+    def _compile_first_stage(self):
+        """
+        First internal compilation stage.
+
+        Finds all subroutine and macros definitions
+        """
+
+        self.current_scope.words = self._scan_definitions(self.current_scope)
 
     def _compile_second_stage(self):
         """
         Second internal compilation stage.
 
         Compiles words into TaggedInstructions.
-        Grants address values to variable pointers.
+        Creates variables, that are given addresses during the layout stage.
         Grants scope references to subroutine pointers.
         Inserts macro code into current scope for processing.
         Inserts address pointer tags for jumps.
         """
 
-        while len(self.current_scope):
-            word = self.current_scope.pop(0)
+        # words that are yet to be processed
+        worklist = deque(self.current_scope)
+        self.current_scope.words = list()
+
+        # origins of macro instances, that are being processed
+        origins = [self.block_name] if self.block_name else []
+        self.origin = self.block_name
+
+        while worklist:
+            word = worklist.popleft()
+
+            # end of macro instance
+            if word is _END_OF_MACRO:
+                origins.pop()
+                self.origin = "/".join(origins)
+                continue
 
             # instructions with arguments
             if word[0].value in self.code_namespace.definitions and len(word) == 2:
@@ -219,7 +317,7 @@ class Compiler:
                 # check if it's numeric
                 is_numeric = True
                 if pointer_name.isnumeric():  # simple numeric
-                    word[1].value = pointer_name
+                    numeric_value = pointer_name
                 elif pointer_name[:2] in GeneralNamespace.number_prefixes:  # prefixed numeric
                     # try converting prefixed to just decimal
                     converted = None
@@ -233,8 +331,7 @@ class Compiler:
                         raise CompilerValueError(f"Unable to convert numeric value '{pointer_name}'",
                                                  line=word.line)
 
-                    # that may be a bit confusing to do it here
-                    word[1].value = str(converted)
+                    numeric_value = str(converted)
                 elif pointer_name[0].isdigit():  # raise error if first character is a digit
                     raise CompilerValueError(f"Unable to convert numeric value '{pointer_name}'",
                                              line=word.line)
@@ -251,28 +348,33 @@ class Compiler:
                         instruction_value = self.pointers[pointer_name]
                     elif pointer_name in self.macros:  # I don't know what that would be
                         raise CompilerNotImplementedError(line=word.line)
-                    else:  # define pointer as generic integer
+                    else:  # define new variable; it's given an address after all code is compiled
                         if word[0].value not in self.code_namespace.variable_making:
                             raise CompilerNameError(f"Accessing undefined variable '{word[0].value}'",
                                                     line=word.line)
-                        self.pointer_counter += 1
-                        self.pointers[pointer_name] = Tag(self.pointer_counter, TagType.POINTER)
+                        self.pointers[pointer_name] = Tag(self._get_variable_name(pointer_name), TagType.VARIABLE)
                         instruction_value = self.pointers[pointer_name]
 
-                # a numeric value
+                # a numeric value (word tags are shared, so a new tag is made)
                 else:
-                    instruction_value = replace(word[1])
+                    instruction_value = Tag(numeric_value, word[1].type)
                 self.instructions.append(TaggedInstruction(
                     flag=is_pointer,
                     value=instruction_value,
-                    opcode=word[0]))
+                    opcode=word[0],
+                    line=word.line,
+                    origin=self.origin,
+                    file=word.file))
 
             # instructions without arguments
             elif word[0].value in self.code_namespace.definitions and len(word) == 1:
                 self.instructions.append(TaggedInstruction(
                     flag=False,
                     value=Tag(0, TagType.INTERNAL),
-                    opcode=word[0]))
+                    opcode=word[0],
+                    line=word.line,
+                    origin=self.origin,
+                    file=word.file))
 
             # macros
             elif word[0].type is TagType.POINTER and word[0].value in self.macros:
@@ -281,9 +383,10 @@ class Compiler:
                     raise CompilerSyntaxError("Missing keyword 'uses'", line=word.line)
 
                 scope = self._generate_macro_scope(word[0].value, word[2:])  # generate formatted macro scope
-                for word in scope[::-1]:  # insert into 'to be processed' scope part
-                    self.current_scope.insert(0, word)
-                self._compile_first_stage()
+                worklist.appendleft(_END_OF_MACRO)
+                worklist.extendleft(reversed(self._scan_definitions(scope)))  # insert into 'to be processed' part
+                origins.append(word[0].value)
+                self.origin = "/".join(origins)
 
             # subroutines with arguments
             elif word[0].value == self.code_namespace.subr_operations["call"] and len(word) > 2:
@@ -291,144 +394,251 @@ class Compiler:
                 if word[2].value != "uses":
                     raise CompilerSyntaxError("Missing keyword 'uses'", line=word.line)
 
-                # append cut call instruction
-                self.current_scope.insert(0, Word(word[:2], line=word.line))
-
                 # generate instructions to push arguments into stack
-                for arg in word[-1:2:-1]:
-                    self.current_scope.insert(0, Word([
-                        Tag(self.code_namespace.stack_operations["push"], TagType.BUILT_IN)
-                    ], line=word.line))
-                    self.current_scope.insert(0, Word([
+                words = []
+                for arg in word[3:]:
+                    words.append(Word([
                         Tag(self.code_namespace.variable_loading["load"], TagType.BUILT_IN),
                         arg
-                    ], line=word.line))
+                    ], line=word.line, file=word.file))
+                    words.append(Word([
+                        Tag(self.code_namespace.stack_operations["push"], TagType.BUILT_IN)
+                    ], line=word.line, file=word.file))
+
+                # append cut call instruction
+                words.append(Word(word[:2], line=word.line, file=word.file))
+
+                # insert into 'to be processed' part
+                worklist.extendleft(reversed(words))
 
             # address pointers
             elif word[0].type is TagType.POINTER and word[0].value in self.address_pointers:
                 self.instructions.append(word[0])
 
-    def _compile_third_stage(self):
+    def _make_block(self, name: str, instructions: list[TaggedInstruction | Tag]) -> CodeBlock:
+        """
+        Makes a relocatable CodeBlock out of instructions.
+        Label offsets are computed and hanging address pointers are removed in a single pass,
+        references to labels and subroutines are recorded as fixups
+        :param name: block name; empty for the main program
+        :param instructions: instructions with address pointer Tags
+        :return: code block
+        """
+
+        block = CodeBlock(name)
+        for instruction in instructions:
+            if isinstance(instruction, Tag):
+                block.labels[instruction.value] = len(block.instructions)
+                continue
+
+            # reference to a label or subroutine
+            value = instruction.value.value
+            if (instruction.value.type is TagType.POINTER and isinstance(value, str) and
+                    (value in self.address_pointers or value in self.subroutines)):
+                block.fixups.append((len(block.instructions), value))
+            block.instructions.append(instruction)
+        return block
+
+    def _compile_third_stage(self, name: str = ""):
         """
         Third internal compilation stage.
 
-        Generates address pointers and inserts them at correct places
+        Makes a relocatable CodeBlock out of compiled instructions
+        :param name: block name; empty for the main program
         """
 
-        # search for all address pointers
-        address_pointers = {}
-        for index, instruction in enumerate(self.instructions):
-            # skip all non-tags
-            if not isinstance(instruction, Tag):
-                continue
-            address_pointers[instruction.value] = index
+        self.blocks.append(self._make_block(name, self.instructions))
+        self.instructions = list()
 
-        # replace all address pointer tags references
-        idx = 0
-        while idx < len(self.instructions):
-            instruction = self.instructions[idx]
-            idx += 1
+    def _compile_block(self, name: str, words: list[Word | Scope]):
+        """
+        Compiles subroutine words into a separate CodeBlock.
+        Variables created by the subroutine are local to it
+        """
 
-            # delete hanging address pointers & correct pointers being offset
-            if isinstance(instruction, Tag):
-                idx -= 1
-                self.instructions.pop(idx)
+        global_pointers = self.pointers
+        self.pointers = ChainMap(dict(), global_pointers)
+        self.block_name = name
 
-                # correct pointers
-                for pointer_name, pointer_address in address_pointers.items():
-                    if pointer_address > idx:
-                        address_pointers[pointer_name] = pointer_address - 1
+        self.current_scope = Scope(words)
+        self._compile_first_stage()
+        self._compile_second_stage()
+        self._compile_third_stage(name)
 
+        # forget variables created by subroutine
+        self.pointers = global_pointers
+        self.block_name = ""
+
+    def _get_variable_name(self, name: str) -> str:
+        """
+        Returns unique name of a variable; variables of subroutines are qualified by subroutine name
+        """
+
+        return f"{self.block_name}:{name}" if self.block_name else name
+
+    def _allocate_variables(self):
+        """
+        Gives data memory addresses to variables of all blocks.
+        Variables with non overlapping lifetimes share addresses at every optimization level
+        """
+
+        allocator = VariableAllocator(self.code_namespace)
+        self.variables = allocator.allocate(self.blocks)
+        self.data_memory_size = allocator.high_water_mark
+
+        tags = {name: Tag(address, TagType.POINTER) for name, address in self.variables.items()}
+        for block in self.blocks:
+            for instruction in block.instructions:
+                if instruction.value.type is TagType.VARIABLE:
+                    instruction.value = tags[instruction.value.value]
+
+    def _layout_blocks(self):
+        """
+        Places all blocks one after another, and patches label and subroutine references.
+        Sets memory flag to False for patched references and store instructions
+        """
+
+        # block name -> address table
+        block_addresses = {}
+        address = 0
+        for block in self.blocks:
+            block_addresses[block.name] = address
+            address += len(block)
+        main_block = self.blocks[0]
+
+        self.symbols = {name: address for name, address in block_addresses.items() if name}
+        self.instructions = list()
+        for block in self.blocks:
+            base_address = block_addresses[block.name]
+            for label, offset in block.labels.items():
+                self.symbols[label] = base_address + offset
+            for idx, symbol in block.fixups:
+                if symbol in block.labels:  # own label
+                    address = base_address + block.labels[symbol]
+                elif symbol in block_addresses:  # subroutine
+                    address = block_addresses[symbol]
+                elif symbol in main_block.labels:  # global label
+                    address = main_block.labels[symbol]
+                else:
+                    continue
+                instruction = block.instructions[idx]
+                instruction.value = Tag(address, TagType.POINTER)
+                instruction.flag = False
+            self.instructions.extend(block.instructions)
+
+        # 2 - store or SRA instructions for Quantum CPU's
         for instruction in self.instructions:
-            # make address pointers
-            if instruction.value.value in address_pointers:
-                instruction.value.value = address_pointers[instruction.value.value]
+            if self.code_namespace.definitions[instruction.opcode.value].opcode == 2:
                 instruction.flag = False
 
     def _compile_forth_stage(self):
         """
         Forth internal compilation stage.
 
-        Inserts subroutines at the end of the 'self.current_scope'.
-        Sets memory flag to False for subroutine calls and store instructions
-        """
-
-        # subroutine name -> address table
-        subroutine_pointers = {}
-
-        # append subroutines at the end of the instruction list
-        for subroutine_name, subroutine_scope in self.subroutines.items():
-            scope = subroutine_scope.__copy__()
-            subroutine_pointers[subroutine_name] = len(self.instructions)
-            for word in scope[1]:
-                self.current_scope.add(word)
-            pre_compilation_pointers = set(self.pointers)
-            pre_compilation_counter = self.pointer_counter
-            self._compile_first_stage()
-            self._compile_second_stage()
-            self._compile_third_stage()
-            post_compilation_pointers = set(self.pointers)
-            post_compilation_counter = self.pointer_counter
-
-            # delete created by subroutine variables, and reset pointer counter by same amount
-            pointer_diff = post_compilation_pointers - pre_compilation_pointers
-            self.pointer_counter -= post_compilation_counter - pre_compilation_counter
-            for pointer in pointer_diff:
-                self.pointers.pop(pointer)
-
-        # go through TaggedInstructions and replace references to 'subroutine_scope' with addresses
-        # from 'locations' table
-        for instruction in self.instructions:
-            # make subroutine pointers
-            if instruction.value.value in subroutine_pointers:
-                instruction.value.value = subroutine_pointers[instruction.value.value]
-                instruction.flag = False
-            # 2 - store or SRA instructions for Quantum CPU's
-            if self.code_namespace.definitions[instruction.opcode.value].opcode == 2:
-                instruction.flag = False
+        Compiles every subroutine once into its own relocatable block
+        """
 
-    def _compile_fifth_stage(self):
+        # subroutines may define other subroutines, so the list can grow
+        subroutine_names = list(self.subroutines)
+        idx = 0
+        while idx < len(subroutine_names):
+            subroutine_name = subroutine_names[idx]
+            idx += 1
+
+            scope = self.subroutines[subroutine_name].__copy__()
+            self._compile_block(subroutine_name, scope[1].words)
+            if len(self.subroutines) > len(subroutine_names):
+                subroutine_names.extend(list(self.subroutines)[len(subroutine_names):])
+
+    def _optimization_stage(self):
         """
-        Fifth internal compilation stage.
+        Optimization stage.
 
-        Converts TaggedInstructions to InstructionN class.
-        If 'self.code_namespace' is set to QM lineage of cpu's, then the output is Instruction16
-        If 'self.code_namespace' is set to QT lineage of cpu's, then the output is Instruction24
+        Inlines subroutine calls at optimization level 3, runs enabled optimization passes
+        over instructions of every code block, then removes dead subroutines and unreachable code
         """
 
-        for instruction in self.instructions:
-            self.bytecode.append(
-                self._convert_tagged2byte(instruction, self.code_namespace))
+        if self.optimizer is None:
+            return
+
+        if self.optimizer.level >= 3:
+            self._inline_subroutines()
+
+        for idx, block in enumerate(self.blocks):
+            self.blocks[idx] = self._make_block(block.name, self.optimizer.run(block.tagged_instructions()))
+
+        # passes may remove the last reference to a subroutine
+        if self.optimizer.level >= 1:
+            self._eliminate_dead_code()
+
+    def _inline_subroutines(self):
+        """
+        Replaces calls of small and single call subroutines with their bodies
+        """
 
-    def _trivial_optimization(self):
+        # subroutine name -> amount of arguments
+        parameters = {
+            name: len(scope[0]) - 3 if len(scope[0]) > 2 else 0 for name, scope in self.subroutines.items()}
+
+        inliner = SubroutineInliner(self.code_namespace, self.inline_budget)
+        bodies = inliner.run(self.blocks, parameters)
+        self.inlined = inliner.inlined
+
+        # renamed labels of inlined bodies
+        for label in inliner.new_labels:
+            self.address_pointers[label] = Tag(label, TagType.POINTER)
+
+        self.blocks = [self._make_block(block.name, bodies[block.name]) for block in self.blocks]
+
+    def _eliminate_dead_code(self):
         """
-        Trivial optimization stage.
+        Removes subroutines, that are never referenced, and code, that is never reached
+        """
+
+        eliminator = DeadCodeEliminator(self.code_namespace)
+        bodies = eliminator.run(self.blocks)
+        self.blocks = [self._make_block(block.name, bodies[block.name])
+                       for block in self.blocks if block.name in bodies]
 
-        Removes unnecessary 'load' / stack instructions
+    def _layout_stage(self):
         """
+        Layout stage.
 
-        accumulator = Tag("ACC", TagType.UNDEFINED)
-        modified = False
+        Gives addresses to variables of all blocks, then lays out all blocks after the main program
+        """
 
-        idx = 0
-        while idx < len(self.instructions):
-            instruction = self.instructions[idx]
-            idx += 1
+        self._allocate_variables()
+        self._layout_blocks()
 
-            # if instruction is variable loading
-            if instruction.opcode.value in self.code_namespace.variable_loading.values():
-                # if there are no modifying instructions before previous load
-                # remove this instruction
-                if accumulator == instruction.value and not modified:
-                    idx -= 1
-                    self.instructions.pop(idx)
+    def _compile_fifth_stage(self):
+        """
+        Fifth internal compilation stage.
 
-                # update values
-                accumulator = instruction.value
-                modified = False
+        Converts TaggedInstructions into a contiguous Bytecode buffer.
+        If 'self.code_namespace' is set to QM lineage of cpu's, then the records are Instruction16
+        If 'self.code_namespace' is set to QT lineage of cpu's, then the records are Instruction24
+        Source files, lines and origins of instructions are kept for every address
+        """
 
-            elif instruction.opcode.value not in self.code_namespace.non_modifying_operations:
-                modified = True
+        source_path = os.path.abspath(self.source_path) if self.source_path is not None else ""
+        self.files = [instruction.file or source_path for instruction in self.instructions]
+        self.lines = [instruction.line for instruction in self.instructions]
+        self.origins = [instruction.origin for instruction in self.instructions]
+
+        instruction_class = self.code_namespace.instruction_class
+        definitions = self.code_namespace.definitions
+        record = instruction_class.record
+        value_mask = instruction_class.value_mask
+        opcode_mask = instruction_class.opcode_mask
+
+        buffer = bytearray(record.size * len(self.instructions))
+        for idx, instruction in enumerate(self.instructions):
+            record.pack_into(
+                buffer, idx * record.size,
+                instruction.flag,
+                int(instruction.value.value) & value_mask,  # make sure it's int
+                definitions[instruction.opcode.value].opcode & opcode_mask)
+        self.bytecode = Bytecode(instruction_class, buffer)
 
     def compile(self):
         """
@@ -441,8 +651,8 @@ class Compiler:
         self._compile_second_stage()
         self._compile_third_stage()
         self._compile_forth_stage()
-
-        # self._trivial_optimization()
+        self._optimization_stage()
+        self._layout_stage()
         self._compile_fifth_stage()
 
         if len(self.instructions) > 0xFFFF:
@@ -0,0 +1,404 @@
+"""
+Debug information of compiled programs
+"""
+
+
+from struct import Struct
+from bisect import bisect_right
+from source.exceptions import *
+
+
+DEBUG_MAGIC: bytes = b"QDBG"
+DEBUG_VERSION: int = 2
+
+# magic, version, amount of sections, amount of instructions
+_HEADER: Struct = Struct(">4sBBI")
+# section name, offset from the start of the file, length
+_SECTION: Struct = Struct(">4sII")
+
+
+def encode_varint(value: int, buffer: bytearray):
+    """
+    Appends unsigned LEB128 integer to buffer
+    """
+
+    while value > 0x7F:
+        buffer.append(value & 0x7F | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def decode_varint(data: bytes, offset: int) -> tuple[int, int]:
+    """
+    Reads unsigned LEB128 integer from data
+    :return: value, and offset after it
+    """
+
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def _zigzag(value: int) -> int:
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def _unzigzag(value: int) -> int:
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def _get_ranges(values: list) -> list[tuple[int, object]]:
+    """
+    Returns (start address, value) of every run of equal values
+    """
+
+    ranges = []
+    for address, value in enumerate(values):
+        if not ranges or ranges[-1][1] != value:
+            ranges.append((address, value))
+    return ranges
+
+
+class DebugInfo:
+    """
+    Debug information of a compiled program: source files, lines and origins of every address,
+    addresses of subroutines and labels, and addresses of variables.
+
+    Stored in a sectioned binary file; the header is followed by a table of sections,
+    so every section is read and decoded only when it's first used.
+    Lines and origins are stored as ranges of addresses with the same value,
+    addresses and lines are delta encoded as LEB128 integers.
+    Source files and origins are stored once in string tables, and ranges refer to them by index
+    """
+
+    def __init__(self, size: int = 0,
+                 lines: list[int] | None = None,
+                 origins: list[str] | None = None,
+                 symbols: dict[str, int] | None = None,
+                 variables: dict[str, int] | None = None,
+                 files: list[str] | None = None):
+        """
+        :param size: amount of instructions
+        :param lines: address -> source line
+        :param origins: address -> subroutine and macros the instruction was expanded from
+        :param symbols: subroutine and label name -> address
+        :param variables: variable name -> data memory address
+        :param files: address -> source file path
+        """
+
+        self.size: int = size
+        self.path: str | None = None  # file, from which sections are loaded
+        self.sections: dict[str, tuple[int, int]] = dict()  # section name -> offset, length
+
+        # decoded sections; None if not loaded yet
+        self._line_ranges: list[tuple[int, str, int]] | None = None
+        if lines is not None:
+            files = files if files is not None else [""] * len(lines)
+            ranges = _get_ranges(list(zip(files, lines)))
+            self._line_ranges = [(address, file, line) for address, (file, line) in ranges]
+        self._origin_ranges: list[tuple[int, str]] | None = _get_ranges(origins) if origins is not None else None
+        self._symbols: dict[str, int] | None = symbols
+        self._variables: dict[str, int] | None = variables
+
+    @classmethod
+    def from_compiler(cls, compiler) -> "DebugInfo":
+        """
+        Collects debug information of the last compilation
+        :param compiler: compiler, after 'compile' was called
+        """
+
+        return cls(len(compiler.instructions), compiler.lines, compiler.origins, compiler.symbols,
+                   compiler.variables, compiler.files)
+
+    # encoding
+
+    @staticmethod
+    def _encode_strings(strings, buffer: bytearray) -> dict[str, int]:
+        """
+        Appends table of unique strings to buffer
+        :return: string -> index in the table
+        """
+
+        table = {string: idx for idx, string in enumerate(dict.fromkeys(strings))}
+        encode_varint(len(table), buffer)
+        for string in table:
+            encoded = string.encode("utf-8")
+            encode_varint(len(encoded), buffer)
+            buffer += encoded
+        return table
+
+    @classmethod
+    def _encode_line_ranges(cls, ranges: list[tuple[int, str, int]]) -> bytearray:
+        # table of source files, then ranges referring to it
+        buffer = bytearray()
+        table = cls._encode_strings((file for _, file, _ in ranges), buffer)
+
+        encode_varint(len(ranges), buffer)
+        last_address = last_line = 0
+        for address, file, line in ranges:
+            encode_varint(address - last_address, buffer)
+            encode_varint(table[file], buffer)
+            encode_varint(_zigzag(line - last_line), buffer)
+            last_address, last_line = address, line
+        return buffer
+
+    @classmethod
+    def _encode_origin_ranges(cls, ranges: list[tuple[int, str]]) -> bytearray:
+        # table of unique origins, then ranges referring to it
+        buffer = bytearray()
+        table = cls._encode_strings((origin for _, origin in ranges), buffer)
+
+        encode_varint(len(ranges), buffer)
+        last_address = 0
+        for address, origin in ranges:
+            encode_varint(address - last_address, buffer)
+            encode_varint(table[origin], buffer)
+            last_address = address
+        return buffer
+
+    @staticmethod
+    def _encode_names(names: dict[str, int]) -> bytearray:
+        # sorted by address, so addresses are delta encoded
+        buffer = bytearray()
+        encode_varint(len(names), buffer)
+        last_address = 0
+        for name, address in sorted(names.items(), key=lambda x: x[1]):
+            encoded = name.encode("utf-8")
+            encode_varint(address - last_address, buffer)
+            encode_varint(len(encoded), buffer)
+            buffer += encoded
+            last_address = address
+        return buffer
+
+    def save(self, file: str) -> int:
+        """
+        Writes debug information to a file
+        :param file: output filepath
+        :return: amount of bytes that were written
+        """
+
+        sections = {
+            b"LINE": self._encode_line_ranges(self.line_ranges),
+            b"ORIG": self._encode_origin_ranges(self.origin_ranges),
+            b"SYMB": self._encode_names(self.symbols),
+            b"VARS": self._encode_names(self.variables),
+        }
+
+        offset = _HEADER.size + _SECTION.size * len(sections)
+        with open(file, "wb") as f:
+            f.write(_HEADER.pack(DEBUG_MAGIC, DEBUG_VERSION, len(sections), self.size))
+            for name, data in sections.items():
+                f.write(_SECTION.pack(name, offset, len(data)))
+                offset += len(data)
+            for data in sections.values():
+                f.write(data)
+            return f.tell()
+
+    # decoding
+
+    @classmethod
+    def load(cls, file: str) -> "DebugInfo":
+        """
+        Opens debug information file. Only the header is read, sections are read when they are used
+        :param file: debug information filepath
+        """
+
+        with open(file, "rb") as f:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                raise CompilerValueError(f"Truncated debug information in '{file}'")
+            magic, version, count, size = _HEADER.unpack(header)
+            if magic != DEBUG_MAGIC or version != DEBUG_VERSION:
+                raise CompilerValueError(f"Unsupported debug information format in '{file}'")
+            table = f.read(_SECTION.size * count)
+
+        info = cls(size)
+        info.path = file
+        for name, offset, length in _SECTION.iter_unpack(table):
+            info.sections[name.decode("ascii")] = (offset, length)
+        return info
+
+    def _read_section(self, name: str) -> bytes:
+        """
+        Reads raw section data from the file; missing sections are empty
+        """
+
+        if self.path is None or name not in self.sections:
+            return b""
+        offset, length = self.sections[name]
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    @staticmethod
+    def _decode_strings(data: bytes, offset: int) -> tuple[list[str], int]:
+        """
+        Reads table of strings from data
+        :return: strings, and offset after the table
+        """
+
+        count, offset = decode_varint(data, offset)
+        table = []
+        for _ in range(count):
+            length, offset = decode_varint(data, offset)
+            table.append(data[offset:offset + length].decode("utf-8"))
+            offset += length
+        return table, offset
+
+    @classmethod
+    def _decode_line_ranges(cls, data: bytes) -> list[tuple[int, str, int]]:
+        if not data:
+            return []
+        table, offset = cls._decode_strings(data, 0)
+
+        count, offset = decode_varint(data, offset)
+        ranges = []
+        address = line = 0
+        for _ in range(count):
+            delta, offset = decode_varint(data, offset)
+            idx, offset = decode_varint(data, offset)
+            line_delta, offset = decode_varint(data, offset)
+            address += delta
+            line += _unzigzag(line_delta)
+            ranges.append((address, table[idx], line))
+        return ranges
+
+    @classmethod
+    def _decode_origin_ranges(cls, data: bytes) -> list[tuple[int, str]]:
+        if not data:
+            return []
+        table, offset = cls._decode_strings(data, 0)
+
+        count, offset = decode_varint(data, offset)
+        ranges = []
+        address = 0
+        for _ in range(count):
+            delta, offset = decode_varint(data, offset)
+            idx, offset = decode_varint(data, offset)
+            address += delta
+            ranges.append((address, table[idx]))
+        return ranges
+
+    @staticmethod
+    def _decode_names(data: bytes) -> dict[str, int]:
+        if not data:
+            return dict()
+        count, offset = decode_varint(data, 0)
+        names = dict()
+        address = 0
+        for _ in range(count):
+            delta, offset = decode_varint(data, offset)
+            length, offset = decode_varint(data, offset)
+            address += delta
+            names[data[offset:offset + length].decode("utf-8")] = address
+            offset += length
+        return names
+
+    # sections
+
+    @property
+    def line_ranges(self) -> list[tuple[int, str, int]]:
+        """
+        (start address, source file, source line) of every run of instructions from the same line
+        """
+
+        if self._line_ranges is None:
+            self._line_ranges = self._decode_line_ranges(self._read_section("LINE"))
+        return self._line_ranges
+
+    @property
+    def origin_ranges(self) -> list[tuple[int, str]]:
+        """
+        (start address, origin) of every run of instructions with the same origin
+        """
+
+        if self._origin_ranges is None:
+            self._origin_ranges = self._decode_origin_ranges(self._read_section("ORIG"))
+        return self._origin_ranges
+
+    @property
+    def symbols(self) -> dict[str, int]:
+        """
+        Subroutine and label name -> address
+        """
+
+        if self._symbols is None:
+            self._symbols = self._decode_names(self._read_section("SYMB"))
+        return self._symbols
+
+    @property
+    def variables(self) -> dict[str, int]:
+        """
+        Variable name -> data memory address
+        """
+
+        if self._variables is None:
+            self._variables = self._decode_names(self._read_section("VARS"))
+        return self._variables
+
+    @staticmethod
+    def _expand(ranges: list[tuple[int, object]], size: int, default) -> list:
+        values = [default] * size
+        for idx, (address, value) in enumerate(ranges):
+            end = ranges[idx + 1][0] if idx + 1 < len(ranges) else size
+            values[address:end] = [value] * (end - address)
+        return values
+
+    @property
+    def files(self) -> list[str]:
+        """
+        Source file of every address
+        """
+
+        return self._expand([(address, file) for address, file, _ in self.line_ranges], self.size, "")
+
+    @property
+    def lines(self) -> list[int]:
+        """
+        Source line of every address
+        """
+
+        return self._expand([(address, line) for address, _, line in self.line_ranges], self.size, -1)
+
+    @property
+    def origins(self) -> list[str]:
+        """
+        Origin of every address
+        """
+
+        return self._expand(self.origin_ranges, self.size, "")
+
+    @staticmethod
+    def _find(ranges: list[tuple], address: int) -> tuple | None:
+        idx = bisect_right(ranges, address, key=lambda x: x[0]) - 1
+        return ranges[idx] if idx >= 0 else None
+
+    def get_file(self, address: int) -> str:
+        """
+        Returns source file of an instruction
+        """
+
+        found = self._find(self.line_ranges, address)
+        return found[1] if found is not None and address < self.size else ""
+
+    def get_line(self, address: int) -> int:
+        """
+        Returns source line of an instruction, or -1 if it's unknown
+        """
+
+        found = self._find(self.line_ranges, address)
+        return found[2] if found is not None and address < self.size else -1
+
+    def get_origin(self, address: int) -> str:
+        """
+        Returns origin of an instruction
+        """
+
+        found = self._find(self.origin_ranges, address)
+        return found[1] if found is not None and address < self.size else ""
@@ -0,0 +1,128 @@
+"""
+Dead subroutine and unreachable code elimination
+"""
+
+
+import logging
+from source.classes import *
+from source.built_ins import *
+from source.cfg import JUMP_KINDS
+
+
+LOGGER = logging.getLogger("eliminator")
+
+
+class DeadCodeEliminator:
+    """
+    Removes code, that can never be executed.
+
+    Subroutines are kept only if they are reachable from the main program,
+    through calls or any other references to them or to their labels.
+    Block, that may run past its end, falls into the next block, so the next block is kept as well.
+    Instructions after an unconditional jump, return or halt are removed up to the next label, that is referenced.
+    Removed code may hold the last reference to a label or subroutine, so it's repeated until nothing changes.
+
+    Only symbolic references are followed; jumps to numeric addresses are not tracked
+    """
+
+    def __init__(self, namespace: CodeNamespace):
+        self.namespace: CodeNamespace = namespace
+
+        self.removed_subroutines: int = 0
+        self.removed_instructions: int = 0  # not counting instructions of removed subroutines
+
+        # opcodes, after which the next instruction is never executed
+        self.terminating: set[str] = set(namespace.halting_operations)
+        self.terminating.add(namespace.subr_operations.get("return"))
+        self.terminating.update(
+            opcode for opcode, kind in namespace.jump_operations.items() if not JUMP_KINDS[kind][1])
+
+    @staticmethod
+    def _get_references(instructions: list[TaggedInstruction | Tag], symbols: dict[str, str]) -> set[str]:
+        """
+        Returns all labels and subroutines, which are referenced by instructions
+        """
+
+        references = set()
+        for instruction in instructions:
+            if isinstance(instruction, Tag):
+                continue
+            value = instruction.value
+            if value.type is TagType.POINTER and isinstance(value.value, str) and value.value in symbols:
+                references.add(value.value)
+        return references
+
+    def _falls_through(self, instructions: list[TaggedInstruction | Tag]) -> bool:
+        """
+        Checks if control may run past the end of instructions
+        """
+
+        for instruction in reversed(instructions):
+            if not isinstance(instruction, Tag):
+                return instruction.opcode.value not in self.terminating
+        return True
+
+    def _remove_unreachable(self, instructions: list[TaggedInstruction | Tag],
+                            referenced: set[str]) -> list[TaggedInstruction | Tag]:
+        """
+        Removes instructions after terminating ones, until a referenced label
+        """
+
+        reachable = []
+        dead = False
+        for instruction in instructions:
+            if isinstance(instruction, Tag):
+                if instruction.value in referenced:
+                    dead = False
+                if not dead:
+                    reachable.append(instruction)
+            elif not dead:
+                reachable.append(instruction)
+                dead = instruction.opcode.value in self.terminating
+        return reachable
+
+    def run(self, blocks: list[CodeBlock]) -> dict[str, list[TaggedInstruction | Tag]]:
+        """
+        Removes dead subroutines and unreachable code
+        :param blocks: compiled code blocks; the main program block has empty name
+        :return: block name -> reachable instructions, for reachable blocks only
+        """
+
+        # label or subroutine name -> name of block, that contains it
+        symbols = {block.name: block.name for block in blocks if block.name}
+        for block in blocks:
+            symbols.update((label, block.name) for label in block.labels)
+
+        # block name -> name of the block placed after it
+        following = {block.name: next_block.name for block, next_block in zip(blocks, blocks[1:])}
+
+        bodies = {block.name: block.tagged_instructions() for block in blocks}
+        while True:
+            # blocks, that are reachable from the main program
+            references = dict()
+            worklist = [""]
+            while worklist:
+                name = worklist.pop()
+                references[name] = self._get_references(bodies[name], symbols)
+                reached = [symbols[symbol] for symbol in references[name]]
+                if name in following and self._falls_through(bodies[name]):
+                    reached.append(following[name])
+                for block_name in reached:
+                    if block_name not in references and block_name not in worklist:
+                        worklist.append(block_name)
+
+            referenced = set().union(*references.values())
+            size = sum(len(bodies[name]) for name in references)
+            bodies = {name: self._remove_unreachable(bodies[name], referenced) for name in references}
+            if sum(len(body) for body in bodies.values()) == size:
+                break
+
+        removed_blocks = [block for block in blocks if block.name not in bodies]
+        self.removed_subroutines = len(removed_blocks)
+        self.removed_instructions = sum(len(block) for block in blocks if block.name in bodies) - sum(
+            1 for body in bodies.values() for instruction in body if not isinstance(instruction, Tag))
+
+        LOGGER.debug(f"{self.removed_subroutines} unreferenced subroutines "
+                     f"({sum(len(block) for block in removed_blocks)} instructions) and "
+                     f"{self.removed_instructions} unreachable instructions removed")
+        return bodies
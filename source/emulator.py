@@ -0,0 +1,455 @@
+"""
+Bytecode emulator for QT and QM cpu's
+"""
+
+
+import logging
+from typing import Callable
+from source.classes import *
+from source.built_ins import *
+from source.file_io import load
+
+
+LOGGER = logging.getLogger("emulator")
+
+
+# flag bits, as they are tested by 'jumpc' masks
+CARRY: int = 0b0001
+SIGN: int = 0b0010
+ZERO: int = 0b0100
+LESS: int = 0b1000
+
+
+# instruction name -> name of emulator method, that executes it
+QT_OPERATIONS: dict[str, str] = {
+    "nop": "_nop",
+    "load": "_load",
+    "store": "_store",
+    "loadp": "_load_pointer",
+    "loadpr": "_load_pointer_register",
+    "storep": "_store_pointer",
+    "tapr": "_transfer_pointer_register",
+    "push": "_push",
+    "pop": "_pop",
+    "call": "_call",
+    "return": "_return",
+    "jump": "_jump",
+    "jumpc": "_jump_conditional",
+    "clf": "_clear_flags",
+    "and": "_and",
+    "or": "_or",
+    "xor": "_xor",
+    "lsl": "_shift_left",
+    "lsr": "_shift_right",
+    "rol": "_rotate_left",
+    "ror": "_rotate_right",
+    "comp": "_compare",
+    "add": "_add",
+    "sub": "_sub",
+    "addc": "_add_carry",
+    "subc": "_sub_carry",
+    "inc": "_increment",
+    "dec": "_decrement",
+    "mul": "_mul",
+    "div": "_div",
+    "mod": "_mod",
+    "portw": "_port_write",
+    "portr": "_port_read",
+    "int": "_interrupt",
+    "halt": "_halt",
+}
+
+QM_OPERATIONS: dict[str, str] = {
+    "NOP": "_nop",
+    "LRA": "_load",
+    "SRA": "_store",
+    "CALL": "_call",
+    "RET": "_return",
+    "JMP": "_jump",
+    "JMPP": "_jump_positive",
+    "JMPZ": "_jump_zero",
+    "JMPN": "_jump_negative",
+    "JMPC": "_jump_carry",
+    "CCF": "_clear_carry",
+    "LRP": "_load_pointer_register",
+    "CCP": "_unsupported",
+    "CRP": "_transfer_pointer_register",
+    "PUSH": "_push",
+    "POP": "_pop",
+    "AND": "_and",
+    "OR": "_or",
+    "XOR": "_xor",
+    "NOT": "_not",
+    "LSC": "_shift_left_carry",
+    "RSC": "_shift_right_carry",
+    "CMP": "_compare_signed",
+    "CMPU": "_compare",
+    "ADC": "_add_carry",
+    "SBC": "_sub_carry",
+    "INC": "_increment",
+    "DEC": "_decrement",
+    "ABS": "_abs",
+    "MUL": "_mul",
+    "DIV": "_div",
+    "MOD": "_mod",
+    "TSE": "_unsupported",
+    "TCE": "_unsupported",
+    "ADD": "_add",
+    "SUB": "_sub",
+    "RPL": "_unsupported",
+    "MULH": "_mul_high",
+    "UI": "_user_input",
+    "UO": "_user_output",
+    "UOC": "_user_output",
+    "UOCR": "_user_output",
+    "LRB": "_unsupported",
+    "SRP": "_store_pointer_register",
+    "TAB": "_unsupported",
+    "PRW": "_port_write",
+    "PRR": "_port_read",
+    "INT": "_interrupt",
+    "HALT": "_halt",
+}
+
+
+class Emulator:
+    """
+    Runs bytecode of QT and QM cpu's.
+
+    Bytecode is decoded once into a table of (handler, flag, value) entries, indexed by address,
+    so every step is a single table lookup and a call.
+    Flag set means the operand is read from data memory at the address in value, otherwise it's the value itself.
+    Jumps and calls go to the operand, 'jumpc' goes to the pointer register, if any flag of the mask is set.
+    Data stack and call stack are separate.
+
+    Ports, interrupts and user I/O are handled by hooks; without hooks port writes are only remembered,
+    and interrupts are counted.
+    Running past the end of the program stops the emulator, like 'halt' does
+    """
+
+    def __init__(self, namespace: CodeNamespace, bytecode: Bytecode | None = None):
+        self.namespace: CodeNamespace = namespace
+        self.mask: int = namespace.max_int
+        self.sign_bit: int = (namespace.max_int + 1) >> 1
+
+        # cpu state
+        self.acc: int = 0
+        self.pr: int = 0
+        self.pc: int = 0
+        self.flags: int = 0
+        self.memory: list[int] = [0] * (namespace.max_int + 1)
+        self.stack: list[int] = list()
+        self.call_stack: list[int] = list()
+        self.ports: dict[int, int] = dict()
+        self.halted: bool = False
+        self.steps: int = 0
+
+        # hooks
+        self.port_write_hooks: dict[int, Callable[["Emulator", int], None]] = dict()
+        self.port_read_hooks: dict[int, Callable[["Emulator"], int]] = dict()
+        self.interrupt_hooks: dict[int, Callable[["Emulator"], None]] = dict()
+        self.input_hook: Callable[["Emulator"], int] | None = None
+        self.output: list[int] = list()  # values written by user output instructions
+        self.interrupts: int = 0
+
+        # opcode -> handler
+        operations = QT_OPERATIONS if isinstance(namespace, NamespaceQT) else QM_OPERATIONS
+        self.handlers: dict[int, Callable[[int, int], None]] = {
+            definition.opcode: getattr(self, operations[name]) for name, definition in namespace.definitions.items()}
+
+        self.bytecode: Bytecode | None = None
+        self.program: list[tuple[Callable[[int, int], None], bool, int]] = list()
+        if bytecode is not None:
+            self.load(bytecode)
+
+    @classmethod
+    def from_file(cls, file: str) -> "Emulator":
+        """
+        Makes an emulator for bytecode file, written by 'file_io.dump'
+        """
+
+        bytecode, namespace = load(file)
+        return cls(namespace, bytecode)
+
+    def load(self, bytecode: Bytecode):
+        """
+        Decodes bytecode into the program table, and resets the cpu
+        """
+
+        self.bytecode = bytecode
+        unknown = self._unknown
+        handlers = self.handlers
+        record = bytecode.instruction_class.record
+        self.program = [(handlers.get(opcode, unknown), bool(flag), value)
+                        for flag, value, opcode in record.iter_unpack(bytecode.buffer)]
+        self.reset()
+
+    def reset(self):
+        """
+        Resets cpu state; data memory is cleared as well
+        """
+
+        self.acc = self.pr = self.pc = self.flags = 0
+        self.memory = [0] * (self.mask + 1)
+        self.stack.clear()
+        self.call_stack.clear()
+        self.ports.clear()
+        self.output.clear()
+        self.halted = False
+        self.steps = 0
+        self.interrupts = 0
+
+    def step(self):
+        """
+        Executes a single instruction
+        """
+
+        self.run(1)
+
+    def run(self, max_steps: int | None = None) -> int:
+        """
+        Runs the program until it halts, or until the step limit is reached
+        :param max_steps: maximal amount of instructions to execute; None for no limit
+        :return: amount of executed instructions
+        """
+
+        program = self.program
+        memory = self.memory
+        size = len(program)
+        limit = max_steps if max_steps is not None else -1
+
+        steps = 0
+        try:
+            while steps != limit and not self.halted:
+                pc = self.pc
+                if pc >= size:
+                    self.halted = True
+                    break
+                handler, flag, value = program[pc]
+                self.pc = pc + 1
+                handler(memory[value] if flag else value, value)
+                steps += 1
+        finally:
+            self.steps += steps
+        return steps
+
+    def _set_result(self, result: int):
+        """
+        Writes result of arithmetic to the accumulator, and sets flags
+        """
+
+        acc = result & self.mask
+        self.acc = acc
+        self.flags = (CARRY if result != acc else 0) | (SIGN if acc & self.sign_bit else 0) | (0 if acc else ZERO)
+
+    def _set_logic(self, result: int):
+        """
+        Writes result of logic operation to the accumulator, and sets flags; carry is cleared
+        """
+
+        self.acc = result
+        self.flags = (SIGN if result & self.sign_bit else 0) | (0 if result else ZERO)
+
+    def _get_signed(self, value: int) -> int:
+        return value - (self.mask + 1) if value & self.sign_bit else value
+
+    # memory and registers
+
+    def _nop(self, operand: int, value: int):
+        pass
+
+    def _load(self, operand: int, value: int):
+        self.acc = operand
+
+    def _store(self, operand: int, value: int):
+        # always writes to the address in value
+        self.memory[value] = self.acc
+
+    def _load_pointer(self, operand: int, value: int):
+        self.acc = self.memory[self.pr]
+
+    def _store_pointer(self, operand: int, value: int):
+        self.memory[self.pr] = self.acc
+
+    def _load_pointer_register(self, operand: int, value: int):
+        self.pr = operand
+
+    def _store_pointer_register(self, operand: int, value: int):
+        self.memory[value] = self.pr
+
+    def _transfer_pointer_register(self, operand: int, value: int):
+        self.pr = self.acc
+
+    def _push(self, operand: int, value: int):
+        self.stack.append(self.acc)
+
+    def _pop(self, operand: int, value: int):
+        if not self.stack:
+            raise EmulatorError("Pop from empty stack", line=self.pc - 1)
+        self.acc = self.stack.pop()
+
+    # control flow
+
+    def _call(self, operand: int, value: int):
+        self.call_stack.append(self.pc)
+        self.pc = operand
+
+    def _return(self, operand: int, value: int):
+        if not self.call_stack:
+            raise EmulatorError("Return with empty call stack", line=self.pc - 1)
+        self.pc = self.call_stack.pop()
+
+    def _jump(self, operand: int, value: int):
+        self.pc = operand
+
+    def _jump_conditional(self, operand: int, value: int):
+        if self.flags & operand:
+            self.pc = self.pr
+
+    def _jump_positive(self, operand: int, value: int):
+        if not self.flags & (SIGN | ZERO):
+            self.pc = operand
+
+    def _jump_zero(self, operand: int, value: int):
+        if self.flags & ZERO:
+            self.pc = operand
+
+    def _jump_negative(self, operand: int, value: int):
+        if self.flags & SIGN:
+            self.pc = operand
+
+    def _jump_carry(self, operand: int, value: int):
+        if self.flags & CARRY:
+            self.pc = operand
+
+    def _clear_flags(self, operand: int, value: int):
+        self.flags = 0
+
+    def _clear_carry(self, operand: int, value: int):
+        self.flags &= ~CARRY
+
+    def _halt(self, operand: int, value: int):
+        self.halted = True
+
+    # logic
+
+    def _and(self, operand: int, value: int):
+        self._set_logic(self.acc & operand)
+
+    def _or(self, operand: int, value: int):
+        self._set_logic(self.acc | operand)
+
+    def _xor(self, operand: int, value: int):
+        self._set_logic(self.acc ^ operand)
+
+    def _not(self, operand: int, value: int):
+        self._set_logic(~self.acc & self.mask)
+
+    def _shift_left(self, operand: int, value: int):
+        self._set_result(self.acc << operand)
+
+    def _shift_right(self, operand: int, value: int):
+        carry = CARRY if operand and (self.acc >> (operand - 1)) & 1 else 0
+        self._set_logic(self.acc >> operand)
+        self.flags |= carry
+
+    def _shift_left_carry(self, operand: int, value: int):
+        self._set_result(self.acc << 1 | self.flags & CARRY)
+
+    def _shift_right_carry(self, operand: int, value: int):
+        carry = CARRY if self.acc & 1 else 0
+        self._set_logic(self.acc >> 1 | (self.sign_bit if self.flags & CARRY else 0))
+        self.flags |= carry
+
+    def _rotate_left(self, operand: int, value: int):
+        bits = self.mask.bit_length()
+        operand %= bits
+        self._set_logic((self.acc << operand | self.acc >> (bits - operand)) & self.mask)
+
+    def _rotate_right(self, operand: int, value: int):
+        bits = self.mask.bit_length()
+        operand %= bits
+        self._set_logic((self.acc >> operand | self.acc << (bits - operand)) & self.mask)
+
+    # arithmetic
+
+    def _compare(self, operand: int, value: int):
+        result = (self.acc - operand) & self.mask
+        self.flags = ((LESS | CARRY if self.acc < operand else 0) | (SIGN if result & self.sign_bit else 0) |
+                      (0 if result else ZERO))
+
+    def _compare_signed(self, operand: int, value: int):
+        acc, operand = self._get_signed(self.acc), self._get_signed(operand)
+        self.flags = (LESS | SIGN if acc < operand else 0) | (ZERO if acc == operand else 0)
+
+    def _add(self, operand: int, value: int):
+        self._set_result(self.acc + operand)
+
+    def _sub(self, operand: int, value: int):
+        self._set_result(self.acc - operand)
+
+    def _add_carry(self, operand: int, value: int):
+        self._set_result(self.acc + operand + (self.flags & CARRY))
+
+    def _sub_carry(self, operand: int, value: int):
+        self._set_result(self.acc - operand - (self.flags & CARRY))
+
+    def _increment(self, operand: int, value: int):
+        self._set_result(self.acc + 1)
+
+    def _decrement(self, operand: int, value: int):
+        self._set_result(self.acc - 1)
+
+    def _abs(self, operand: int, value: int):
+        self._set_logic(abs(self._get_signed(self.acc)) & self.mask)
+
+    def _mul(self, operand: int, value: int):
+        self._set_result(self.acc * operand)
+
+    def _mul_high(self, operand: int, value: int):
+        self._set_logic((self.acc * operand >> self.mask.bit_length()) & self.mask)
+
+    def _div(self, operand: int, value: int):
+        # division by zero gives zero, and sets carry
+        if operand:
+            self._set_logic(self.acc // operand)
+        else:
+            self._set_logic(0)
+            self.flags |= CARRY
+
+    def _mod(self, operand: int, value: int):
+        if operand:
+            self._set_logic(self.acc % operand)
+        else:
+            self._set_logic(0)
+            self.flags |= CARRY
+
+    # input and output
+
+    def _port_write(self, operand: int, value: int):
+        self.ports[operand] = self.acc
+        if (hook := self.port_write_hooks.get(operand)) is not None:
+            hook(self, self.acc)
+
+    def _port_read(self, operand: int, value: int):
+        hook = self.port_read_hooks.get(operand)
+        self.acc = (hook(self) if hook is not None else self.ports.get(operand, 0)) & self.mask
+
+    def _interrupt(self, operand: int, value: int):
+        self.interrupts += 1
+        if (hook := self.interrupt_hooks.get(operand)) is not None:
+            hook(self)
+
+    def _user_input(self, operand: int, value: int):
+        self.acc = self.input_hook(self) & self.mask if self.input_hook is not None else 0
+
+    def _user_output(self, operand: int, value: int):
+        self.output.append(self.acc)
+
+    # errors
+
+    def _unsupported(self, operand: int, value: int):
+        raise EmulatorError("Instruction is not supported by the emulator", line=self.pc - 1)
+
+    def _unknown(self, operand: int, value: int):
+        raise EmulatorError("Unknown opcode", line=self.pc - 1)
@@ -37,6 +37,25 @@ class CompilerIndentationError(CompilerError):
     """
 
 
+class CompilerIncludeError(CompilerError):
+    """
+    Error when including source files
+    """
+
+
+class CompilerMemoryError(CompilerError):
+    """
+    Error when program doesn't fit into data memory
+    """
+
+
+class EmulatorError(CompilerError):
+    """
+    Error when running bytecode in the emulator.
+    Line is the address of the instruction, that caused it
+    """
+
+
 class CompilerNotImplementedError(CompilerError):
     """
     Yes.
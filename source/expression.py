@@ -0,0 +1,191 @@
+"""
+Integer constant expression evaluator for the preprocessor
+"""
+
+
+import re
+from functools import lru_cache
+from typing import Any, Callable
+from source.exceptions import *
+
+
+# numbers (any python int literal), names, operators and parentheses
+TOKEN_PATTERN = re.compile(r"\s*(?:(\d\w*)|([A-Za-z_]\w*)|(\*\*|//|<<|>>|[-+*/%&|^~()]))")
+
+# binary operators and their precedence, from lowest to highest
+BINARY_OPERATORS: dict[str, int] = {
+    "|": 1,
+    "^": 2,
+    "&": 3,
+    "<<": 4, ">>": 4,
+    "+": 5, "-": 5,
+    "*": 6, "/": 6, "//": 6, "%": 6,
+}
+UNARY_PRECEDENCE: int = 7
+POWER_PRECEDENCE: int = 8
+
+# limits, that keep the evaluation from exhausting memory or time
+MAX_BITS: int = 4096
+
+
+@lru_cache(maxsize=4096)
+def _tokenize(expression: str) -> tuple[str, ...]:
+    """
+    Splits expression into tokens
+    :param expression: expression string
+    :return: tuple of tokens
+    """
+
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = TOKEN_PATTERN.match(expression, position)
+        if match is None:
+            raise CompilerSyntaxError(f"Unexpected character '{expression[position:].lstrip()[:1]}'")
+        tokens.append(match.group(match.lastindex))
+        position = match.end()
+    return tuple(tokens)
+
+
+def _to_int(value: str) -> int:
+    """
+    Converts numeric literal to int
+    """
+
+    try:
+        return int(value, 0)
+    except ValueError:
+        raise CompilerValueError(f"Unable to convert numeric value '{value}'")
+
+
+def _apply(operator: str, left: int, right: int) -> int:
+    """
+    Applies binary operator to two integers
+    """
+
+    match operator:
+        case "|":
+            return left | right
+        case "^":
+            return left ^ right
+        case "&":
+            return left & right
+        case "<<":
+            if right < 0 or left.bit_length() + right > MAX_BITS:
+                raise CompilerValueError(f"Shift by '{right}' is out of range")
+            return left << right
+        case ">>":
+            if right < 0:
+                raise CompilerValueError(f"Shift by '{right}' is out of range")
+            return left >> right
+        case "+":
+            return left + right
+        case "-":
+            return left - right
+        case "*":
+            return left * right
+        case "**":
+            if right < 0 or left.bit_length() * right > MAX_BITS:
+                raise CompilerValueError(f"Power of '{right}' is out of range")
+            return left ** right
+
+    if right == 0:
+        raise CompilerValueError("Division by zero")
+    match operator:
+        case "/":  # truncated division
+            quotient = abs(left) // abs(right)
+            return quotient if (left < 0) == (right < 0) else -quotient
+        case "//":
+            return left // right
+        case _:  # "%"
+            return left % right
+
+
+class _ExpressionParser:
+    """
+    Precedence climbing parser, that evaluates tokens while parsing them
+    """
+
+    def __init__(self, tokens: tuple[str | int, ...]):
+        self.tokens: tuple[str | int, ...] = tokens
+        self.position: int = 0
+
+    def _peek(self) -> str | int | None:
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _next(self) -> str | int:
+        token = self._peek()
+        if token is None:
+            raise CompilerSyntaxError("Unexpected end of expression")
+        self.position += 1
+        return token
+
+    def _parse_operand(self) -> int:
+        token = self._next()
+        if isinstance(token, int):
+            value = token
+        elif token == "(":
+            value = self.parse_expression(0)
+            if self._next() != ")":
+                raise CompilerSyntaxError("Expected ')'")
+        elif token in ("-", "+", "~"):
+            value = self.parse_expression(UNARY_PRECEDENCE)
+            return -value if token == "-" else ~value if token == "~" else value
+        else:
+            raise CompilerSyntaxError(f"Unexpected token '{token}'")
+
+        # power binds tighter than unary operators on its left, and is right associative
+        if self._peek() == "**":
+            self.position += 1
+            value = _apply("**", value, self.parse_expression(UNARY_PRECEDENCE))
+        return value
+
+    def parse_expression(self, min_precedence: int) -> int:
+        left = self._parse_operand()
+        while (operator := self._peek()) in BINARY_OPERATORS and BINARY_OPERATORS[operator] > min_precedence:
+            self.position += 1
+            right = self.parse_expression(BINARY_OPERATORS[operator])
+            left = _apply(operator, left, right)
+        return left
+
+    def parse(self) -> int:
+        value = self.parse_expression(0)
+        if self._peek() is not None:
+            raise CompilerSyntaxError(f"Unexpected token '{self._peek()}'")
+        return value
+
+
+@lru_cache(maxsize=4096)
+def _evaluate_tokens(tokens: tuple[str | int, ...]) -> int:
+    """
+    Evaluates resolved tokens. Results are cached by expression
+    """
+
+    try:
+        return _ExpressionParser(tokens).parse()
+    except RecursionError:
+        raise CompilerSyntaxError("Expression is nested too deeply")
+
+
+def evaluate(expression: str, names: Callable[[str], Any] | None = None) -> int:
+    """
+    Evaluates integer constant expression.
+    Supports arithmetic, shifts, bitwise operators and parentheses.
+    :param expression: expression string
+    :param names: callable, that returns a value for the name, or None if the name is undefined
+    :return: evaluated integer
+    """
+
+    tokens = []
+    for token in _tokenize(expression):
+        first = token[0]
+        if first.isdigit():
+            token = _to_int(token)
+        elif first.isalpha() or first == "_":
+            value = names(token) if names is not None else None
+            if value is None:
+                raise CompilerNameError(f"Undefined name '{token}'")
+            token = value if isinstance(value, int) else _to_int(str(value))
+        tokens.append(token)
+    return _evaluate_tokens(tuple(tokens))
@@ -3,17 +3,65 @@ File reading and writing implementations.
 """
 
 
+import os
+import glob
 from source.classes import *
 from source.built_ins import *
+from source.debug_info import DebugInfo
 
 
-def dump(data: list[InstructionN], file: str, namespace: CodeNamespace) -> int:
+SOURCE_EXTENSION = ".ql"
+BYTECODE_EXTENSION = ".bin"
+DEBUG_EXTENSION = ".dbg"
+
+
+def collect_inputs(patterns: list[str]) -> list[str]:
+    """
+    Collects input files from paths, directories and glob patterns.
+    Directories are searched recursively for source files
+    :param patterns: list of paths, directories or glob patterns
+    :return: list of unique file paths, in order they were found
+    """
+
+    paths = dict()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = glob.glob(os.path.join(glob.escape(pattern), "**", f"*{SOURCE_EXTENSION}"), recursive=True)
+        elif glob.has_magic(pattern):
+            matches = glob.glob(pattern, recursive=True)
+        else:
+            matches = [pattern]
+        for path in sorted(matches):
+            if not os.path.isdir(path):
+                paths[os.path.normpath(path)] = None
+    return list(paths)
+
+
+def get_output_path(path: str) -> str:
+    """
+    Returns bytecode output path next to the source file
+    """
+
+    return os.path.splitext(path)[0] + BYTECODE_EXTENSION
+
+
+def get_debug_path(path: str) -> str:
+    """
+    Returns debug information path next to the bytecode file
+    """
+
+    return os.path.splitext(path)[0] + DEBUG_EXTENSION
+
+
+def dump(data: Bytecode | list[InstructionN], file: str, namespace: CodeNamespace,
+         debug_info: DebugInfo | None = None) -> int:
     """
     Dumps instruction data to a file
     :param data: instruction data
     :param file: dump filepath
     :param namespace: used instruction namespace
-    :return: amount of bytes that were written
+    :param debug_info: debug information, written next to the dump file
+    :return: amount of bytes that were written to the dump file
     """
 
     if isinstance(namespace, NamespaceQT):
@@ -23,8 +71,53 @@ def dump(data: list[InstructionN], file: str, namespace: CodeNamespace) -> int:
     else:
         raise Exception
 
+    if not isinstance(data, Bytecode):
+        bytecode = Bytecode(namespace.instruction_class)
+        for instruction in data:
+            bytecode.append(instruction)
+        data = bytecode
+
+    if debug_info is not None:
+        debug_info.save(get_debug_path(file))
+
     with open(file, "wb") as f:
         f.write(used_namespace.encode("ascii") + b'\x00')  # add small architecture header
-        for instruction in data:
-            f.write(instruction.__bytes__())
+        f.write(data.view())  # all instructions in one write
         return f.tell()
+
+
+def load(file: str) -> tuple[Bytecode, CodeNamespace]:
+    """
+    Loads instruction data from a file, written by 'dump'
+    :param file: dump filepath
+    :return: bytecode, and instruction namespace it was compiled for
+    """
+
+    with open(file, "rb") as f:
+        data = f.read()
+
+    header, separator, buffer = data.partition(b'\x00')
+    match header:
+        case b"QT":
+            namespace = NamespaceQT()
+        case b"QM":
+            namespace = NamespaceQMr11()
+        case _:
+            raise CompilerValueError(f"Unknown bytecode header in '{file}'")
+
+    if not separator or len(buffer) % namespace.instruction_class.record.size:
+        raise CompilerValueError(f"Truncated bytecode in '{file}'")
+    return Bytecode(namespace.instruction_class, bytearray(buffer)), namespace
+
+
+def load_debug_info(file: str) -> DebugInfo | None:
+    """
+    Opens debug information of a dump file, written by 'dump'. Sections are read when they are used
+    :param file: dump filepath
+    :return: debug information, or None if there is none
+    """
+
+    path = get_debug_path(file)
+    if not os.path.isfile(path):
+        return None
+    return DebugInfo.load(path)
@@ -0,0 +1,248 @@
+"""
+Inlining of subroutine calls
+"""
+
+
+import logging
+from source.classes import *
+from source.built_ins import *
+
+
+LOGGER = logging.getLogger("inliner")
+
+
+class SubroutineInliner:
+    """
+    Replaces calls of small subroutines, and of subroutines called only once, with their bodies.
+
+    Works on TaggedInstructions of compiled code blocks, before any other optimization.
+    Callees are processed before their callers, so inlined bodies are already inlined themselves.
+    Recursive subroutines, and subroutines that don't end with a return, are never inlined.
+
+    Arguments are passed through parameter variables instead of the stack:
+    'load a' 'push' 'load b' 'push' 'call name' of 'subr name uses x y' becomes 'load b' 'store y' 'load a' 'store x',
+    and the 'pop' 'store param' prologue of the subroutine is dropped.
+    Pairs are emitted in reverse, so the first argument is left in the accumulator, as it is after the prologue.
+    Labels of every inlined body are renamed, returns in the middle of the body become jumps to its end
+    """
+
+    def __init__(self, namespace: CodeNamespace, budget: int = 16):
+        self.namespace: CodeNamespace = namespace
+        self.budget: int = budget  # maximal size of inlined subroutine, that is called more than once
+
+        self.bodies: dict[str, list[TaggedInstruction | Tag]] = dict()
+        self.parameters: dict[str, int] = dict()
+        self.labels: dict[str, set[str]] = dict()
+        self.new_labels: list[str] = list()  # labels, that were made by renaming
+        self.inlined: int = 0  # amount of inlined calls
+
+        self.call_opcode: str = namespace.subr_operations.get("call")
+        self.return_opcode: str = namespace.subr_operations.get("return")
+        self.jump_opcode: str | None = next(
+            (opcode for opcode, kind in namespace.jump_operations.items() if kind == "direct"), None)
+
+    def _get_callee(self, instruction: TaggedInstruction | Tag) -> str | None:
+        """
+        Returns name of subroutine, that is directly called by the instruction
+        """
+
+        if (isinstance(instruction, Tag) or instruction.opcode.value != self.call_opcode or instruction.flag or
+                instruction.value.type is not TagType.POINTER or instruction.value.value not in self.bodies):
+            return None
+        return instruction.value.value
+
+    def _find_recursive(self) -> set[str]:
+        """
+        Finds subroutines, that may call themselves
+        """
+
+        callees = {name: {self._get_callee(x) for x in body} - {None} for name, body in self.bodies.items() if name}
+        recursive = set()
+        for name in callees:
+            seen = set()
+            stack = list(callees[name])
+            while stack:
+                callee = stack.pop()
+                if callee == name:
+                    recursive.add(name)
+                    break
+                if callee not in seen:
+                    seen.add(callee)
+                    stack.extend(callees.get(callee, ()))
+        return recursive
+
+    def _get_order(self) -> list[str]:
+        """
+        Returns block names, so that callees come before their callers; the main program is the last
+        """
+
+        order = []
+        visited = set()
+
+        def visit(name: str):
+            visited.add(name)
+            for instruction in self.bodies[name]:
+                callee = self._get_callee(instruction)
+                if callee is not None and callee not in visited:
+                    visit(callee)
+            order.append(name)
+
+        for block_name in self.bodies:
+            if block_name and block_name not in visited:
+                visit(block_name)
+        return order + [""]
+
+    def _is_inlinable(self, name: str, call_counts: dict[str, int], recursive: set[str]) -> bool:
+        """
+        Checks if calls of the subroutine can be replaced by its body
+        """
+
+        body = self.bodies[name]
+        instructions = [x for x in body if not isinstance(x, Tag)]
+        if name in recursive or not instructions or instructions[-1].opcode.value != self.return_opcode:
+            return False
+
+        # returns in the middle of the body need a jump
+        returns = sum(1 for x in instructions if x.opcode.value == self.return_opcode)
+        if returns > 1 and self.jump_opcode is None:
+            return False
+
+        size = len(instructions) - 2 * self.parameters.get(name, 0) - 1
+        return size <= self.budget or call_counts.get(name, 0) == 1
+
+    def _get_parameter_stores(self, name: str) -> list[Tag] | None:
+        """
+        Returns parameter variables in order of arguments, if the subroutine starts with a 'pop' 'store' prologue
+        """
+
+        count = self.parameters.get(name, 0)
+        body = self.bodies[name]
+        if len(body) < 2 * count:
+            return None
+
+        stores = []
+        for idx in range(count):
+            pop, store = body[2 * idx], body[2 * idx + 1]
+            if (isinstance(pop, Tag) or isinstance(store, Tag) or
+                    pop.opcode.value != self.namespace.stack_operations["pop"] or
+                    store.opcode.value not in self.namespace.variable_making or
+                    store.value.type is not TagType.VARIABLE):
+                return None
+            stores.append(store.value)
+
+        # arguments are popped in reverse order
+        return stores[::-1]
+
+    def _get_arguments(self, host: list[TaggedInstruction | Tag], count: int) -> list[TaggedInstruction] | None:
+        """
+        Returns argument loads of the call at the end of host instructions, if they are 'load' 'push' pairs
+        """
+
+        if len(host) < 2 * count:
+            return None
+
+        loads = []
+        loading = set(self.namespace.variable_loading.values())
+        for idx in range(len(host) - 2 * count, len(host), 2):
+            load, push = host[idx], host[idx + 1]
+            if (isinstance(load, Tag) or isinstance(push, Tag) or load.opcode.value not in loading or
+                    push.opcode.value != self.namespace.stack_operations["push"]):
+                return None
+            loads.append(load)
+        return loads
+
+    def _expand(self, name: str, host: list[TaggedInstruction | Tag]):
+        """
+        Appends inlined body of the subroutine to host instructions, replacing the argument pushes
+        """
+
+        body = self.bodies[name]
+        count = self.parameters.get(name, 0)
+
+        # pass arguments through parameter variables, unless an argument is a parameter itself
+        parameters = self._get_parameter_stores(name)
+        arguments = self._get_arguments(host, count) if parameters is not None else None
+        if arguments is not None and not any(load.value in parameters for load in arguments):
+            # the first argument is stored last, so it's left in the accumulator like after the prologue
+            del host[len(host) - 2 * count:]
+            for load, parameter in reversed(list(zip(arguments, parameters))):
+                host.append(load)
+                host.append(TaggedInstruction(
+                    flag=False,
+                    value=parameter,
+                    opcode=Tag(self.namespace.variable_making[0], TagType.BUILT_IN),
+                    line=load.line,
+                    origin=load.origin,
+                    file=load.file))
+            body = body[2 * count:]
+
+        # unique labels for this instance
+        self.inlined += 1
+        renamed = {label: f"{label}:{name}:{self.inlined}" for label in self.labels[name]}
+        self.new_labels.extend(renamed.values())
+        end_label = f"@return:{name}:{self.inlined}"
+
+        last = max(idx for idx, instruction in enumerate(body) if not isinstance(instruction, Tag))
+        jumps_to_end = False
+        for idx, instruction in enumerate(body):
+            if isinstance(instruction, Tag):
+                host.append(Tag(renamed.get(instruction.value, instruction.value), instruction.type))
+            elif instruction.opcode.value == self.return_opcode:
+                if idx != last:
+                    jumps_to_end = True
+                    host.append(TaggedInstruction(
+                        flag=False,
+                        value=Tag(end_label, TagType.POINTER),
+                        opcode=Tag(self.jump_opcode, TagType.BUILT_IN),
+                        line=instruction.line,
+                        origin=instruction.origin,
+                        file=instruction.file))
+            else:
+                value = instruction.value
+                if value.type is TagType.POINTER and value.value in renamed:
+                    value = Tag(renamed[value.value], TagType.POINTER)
+                host.append(TaggedInstruction(
+                    instruction.flag, value, instruction.opcode, instruction.line, instruction.origin,
+                    instruction.file))
+
+        if jumps_to_end:
+            self.new_labels.append(end_label)
+            host.append(Tag(end_label, TagType.POINTER))
+
+    def run(self, blocks: list[CodeBlock], parameters: dict[str, int]) -> dict[str, list[TaggedInstruction | Tag]]:
+        """
+        Inlines subroutine calls within all code blocks
+        :param blocks: compiled code blocks; the main program block has empty name
+        :param parameters: subroutine name -> amount of parameters
+        :return: block name -> instructions with inlined calls
+        """
+
+        self.bodies = {block.name: block.tagged_instructions() for block in blocks}
+        self.labels = {block.name: set(block.labels) for block in blocks}
+        self.parameters = parameters
+
+        call_counts = dict()
+        for body in self.bodies.values():
+            for instruction in body:
+                callee = self._get_callee(instruction)
+                if callee is not None:
+                    call_counts[callee] = call_counts.get(callee, 0) + 1
+
+        recursive = self._find_recursive()
+        inlinable = {name for name in self.bodies if name and self._is_inlinable(name, call_counts, recursive)}
+
+        for name in self._get_order():
+            host = []
+            for instruction in self.bodies[name]:
+                callee = self._get_callee(instruction)
+                if callee in inlinable:
+                    self._expand(callee, host)
+                else:
+                    host.append(instruction)
+            self.bodies[name] = host
+
+            # labels of inlined subroutines now belong to the caller, and have to be renamed when it's inlined
+            self.labels[name] = {instruction.value for instruction in host if isinstance(instruction, Tag)}
+
+        LOGGER.debug(f"{self.inlined} subroutine calls inlined, {len(inlinable)} subroutines eligible")
+        return self.bodies
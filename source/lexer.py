@@ -3,10 +3,19 @@ Lexer code
 """
 
 
+import re
+import sys
+from io import StringIO
+from typing import Iterable, Iterator
 from source.classes import *
 from source.built_ins import *
 
 
+# leading indentation, and tags separated by whitespace
+INDENT_PATTERN = re.compile(r"[ \t]*")
+TAG_PATTERN = re.compile(r"[^ \t\r\n]+")
+
+
 class Lexer:
     """
     Lexer class
@@ -14,86 +23,99 @@ class Lexer:
 
     code_namespace: CodeNamespace = NamespaceQT()
 
+    _keyword_tables: dict[type, dict[str, TagType]] = dict()
+
     def __init__(self):
-        self.raw_code: str = ""
+        self.source: Iterable[str] = ()
+        self.symbols: dict[str, Tag] = dict()
+        self.line_cache: dict[str, tuple[Tag, ...]] | None = None
         self.current_scope: GlobalScope = GlobalScope()
 
-    def import_code(self, code: str) -> None:
+    def import_code(self, code: str | Iterable[str]) -> None:
         """
-        Imports code into Lexer
-        :param code: code string
+        Imports code into Lexer.
+        Nothing is read until the code is tokenized
+        :param code: code string, or any iterable of code lines (like an opened file)
         """
 
-        self.raw_code = ""
-        for line in code.split("\n"):
-            line = line.replace("\r", "")  # delete carriage return
-            code_line = line.split(";")[0].rstrip(" ")  # split by comment ';', strip spaces of the right
-
-            # add any code that is present
-            code_line = code_line.replace(" " * 4, "\t")  # replace 4 spaces with \t
-            self.raw_code += code_line + "\n"  # append line
+        self.source = StringIO(code) if isinstance(code, str) else code
 
-    def _eval_first_stage(self):
+    @classmethod
+    def _get_keyword_table(cls, namespace: CodeNamespace) -> dict[str, TagType]:
         """
-        First internal evaluation stage.
-
-        In this stage code is analyzed letter-by-letter.
-        Each complete code-word is compiled into Tag class.
-        After newline, all tags on the line make a complete Word class.
-        All words are appended to global scope, no additional scopes are generated.
+        Returns merged keyword table for given code namespace.
+        General built-ins take precedence over code namespace definitions
+        :param namespace: code namespace
+        :return: keyword -> TagType table
         """
 
-        line_count = 1
-
-        buffer = ""
-        word = Word()
-
-        for char in self.raw_code:
-            if char == " ":  # tag separator
-                if buffer:
-                    word.tags.append(Tag(buffer))
-                    buffer = ""
-            elif char == "\n" or char == "\t":  # special characters
-                if buffer:  # append last tag from buffer
-                    word.add(Tag(buffer))
-                if len(word.tags) > 0:  # make and append the word
-                    word.line = line_count
-                    self.current_scope.add(word)
-                    word = Word()
-                    buffer = ""
-                if char == "\t":  # level up
-                    word.insert(0, Tag(">", TagType.INTERNAL))
-                if char == "\n":  # increment line counter
-                    line_count += 1
-            else:  # any other character
-                buffer += char
-
-    def _eval_second_stage(self):
-        """
-        Second internal evaluation stage.
+        table = cls._keyword_tables.get(type(namespace))
+        if table is None:
+            table = {name: definition.type for name, definition in namespace.definitions.items()}
+            table.update({name: definition.type for name, definition in GeneralNamespace.definitions.items()})
+            cls._keyword_tables[type(namespace)] = table
+        return table
 
-        In this stage everything is analyzed tag-by-tag.
-        Every tag is simply being assigned a type
+    def tokenize(self) -> Iterator[Word]:
+        """
+        Lazily tokenizes imported code.
+
+        In this stage code is analyzed line-by-line, while it's being read.
+        Each line is split into tags by precompiled pattern, and every tag is assigned a type.
+        Leading indentation levels are prepended as INTERNAL '>' tags.
+        Every symbol is interned, so equal tags are shared between words.
+        If 'self.line_cache' is set, tags of lines that were already seen are reused.
+        :return: iterator of words
         """
 
-        for word in self.current_scope:
-            word: Word  # help type hinting
-            for tag in word:
-                if tag.type is not TagType.UNDEFINED:
-                    continue
-                if tag.value in GeneralNamespace.definitions:
-                    tag.type = GeneralNamespace.definitions[tag.value].type
-                elif tag.value in self.code_namespace.definitions:
-                    tag.type = self.code_namespace.definitions[tag.value].type
-                elif tag.value[0] == "#":
-                    tag.type = TagType.INTERNAL
-                else:
-                    tag.type = TagType.POINTER
+        keywords = self._get_keyword_table(self.code_namespace)
+        symbols = self.symbols
+        indent_tag = Tag(">", TagType.INTERNAL)
+
+        line_cache = self.line_cache
+        next_line_cache = dict() if line_cache is not None else None
+
+        for line_count, line in enumerate(self.source, start=1):
+            # reuse tags of unchanged lines
+            tags = line_cache.get(line) if line_cache is not None else None
+            if tags is not None:
+                next_line_cache[line] = tags
+                if tags:
+                    yield Word(list(tags), line_count)
+                continue
+
+            code_line = line.partition(";")[0]  # split by comment ';'
+            values = TAG_PATTERN.findall(code_line)
+
+            # level up for every indent (4 spaces or \t)
+            tags = []
+            if values and code_line[0] in " \t":
+                indent = INDENT_PATTERN.match(code_line).group().replace(" " * 4, "\t")
+                tags.extend([indent_tag] * indent.count("\t"))
+
+            for value in values:
+                tag = symbols.get(value)
+                if tag is None:  # intern new symbol
+                    tag_type = keywords.get(value)
+                    if tag_type is None:
+                        tag_type = TagType.INTERNAL if value[0] == "#" else TagType.POINTER
+                    tag = symbols[value] = Tag(sys.intern(value), tag_type)
+                tags.append(tag)
+
+            if next_line_cache is not None:
+                next_line_cache[line] = tuple(tags)
+
+            # skip lines without any code
+            if tags:
+                yield Word(tags, line_count)
+
+        if next_line_cache is not None:
+            self.line_cache = next_line_cache
 
     def evaluate(self):
         """
-        Evaluates imported code
+        Evaluates imported code.
+        All words are appended to global scope, no additional scopes are generated
         """
 
-        self._eval_first_stage()
-        self._eval_second_stage()
+        self.current_scope.words.extend(self.tokenize())
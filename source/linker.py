@@ -4,6 +4,8 @@ but will be used during preprocessor stage
 """
 
 
+import os
+from typing import Iterable
 from source.classes import *
 from source.built_ins import *
 from source.lexer import Lexer
@@ -12,14 +14,18 @@ from source.parser import Parser
 
 class Linker:
     """
-    Main linker class
+    Main linker class.
+    Keeps parsed modules, so every file is lexed and parsed at most once per build
     """
 
     def __init__(self, namespace: CodeNamespace):
         self.current_scope: Scope | None = None
         self.code_namespace: CodeNamespace = namespace
 
-    def import_code(self, code: str):
+        self.symbols: dict[str, Tag] = dict()
+        self.modules: dict[str, Scope] = dict()
+
+    def import_code(self, code: str | Iterable[str]):
         """
         Imports code into linker
         """
@@ -27,6 +33,7 @@ class Linker:
         # Lexing stage
         lexer = Lexer()
         lexer.code_namespace = self.code_namespace
+        lexer.symbols = self.symbols
         lexer.import_code(code)
         lexer.evaluate()
 
@@ -37,3 +44,30 @@ class Linker:
 
         # get current scope from parser stage
         self.current_scope = parser.current_scope
+
+    @classmethod
+    def _set_file(cls, scope: Scope, path: str):
+        """
+        Marks all words of the scope as coming from the file
+        """
+
+        for word in scope:
+            if isinstance(word, Scope):
+                cls._set_file(word, path)
+            else:
+                word.file = path
+
+    def load(self, path: str) -> Scope:
+        """
+        Loads parsed module from file
+        :param path: file path
+        :return: copy of parsed module scope
+        """
+
+        path = os.path.abspath(path)
+        if path not in self.modules:
+            with open(path, "r", encoding="ascii") as file:
+                self.import_code(file)
+            self._set_file(self.current_scope, path)
+            self.modules[path] = self.current_scope
+        return self.modules[path].__copy__()
@@ -0,0 +1,333 @@
+"""
+Optimization passes over compiled instructions
+"""
+
+
+import logging
+from time import perf_counter
+from itertools import islice
+from dataclasses import dataclass
+from source.classes import *
+from source.built_ins import *
+from source.cfg import ControlFlowGraph, Liveness, ACCUMULATOR
+
+
+LOGGER = logging.getLogger("optimizer")
+
+
+@dataclass
+class PassStatistics:
+    """
+    Accumulated statistics of a single optimization pass
+    """
+
+    name: str
+    runs: int = 0
+    removed: int = 0
+    rewritten: int = 0
+    elapsed: float = 0.0
+
+
+class OptimizationPass:
+    """
+    Base class for optimization passes.
+
+    Passes work on a list of TaggedInstructions of a single code block,
+    before label and subroutine references are resolved.
+    Address pointer Tags in the list mark label positions
+    """
+
+    name: str = "pass"
+    level: int = 1  # minimal optimization level the pass is enabled at
+
+    def __init__(self, namespace: CodeNamespace):
+        self.namespace: CodeNamespace = namespace
+        self.rewritten: int = 0  # amount of instructions replaced by the pass
+
+    def run(self, instructions: list[TaggedInstruction | Tag]) -> list[TaggedInstruction | Tag]:
+        """
+        Runs the pass
+        :param instructions: instructions of a code block
+        :return: optimized instructions
+        """
+
+        raise NotImplementedError
+
+    @staticmethod
+    def _get_immediate(instruction: TaggedInstruction) -> int | None:
+        """
+        Returns numeric immediate value of an instruction, or None if it doesn't have one
+        """
+
+        value = instruction.value.value
+        if instruction.flag or not isinstance(value, str) or not value.isdigit():
+            return None
+        return int(value)
+
+    def _flags_dead(self, instructions: list[TaggedInstruction | Tag], idx: int) -> bool:
+        """
+        Checks if flags, set by instruction at given index, are overwritten before anything can read them.
+        Labels, control flow and the end of the block are considered as flag reads
+        """
+
+        for instruction in islice(instructions, idx + 1, None):
+            if isinstance(instruction, Tag):
+                return False
+            opcode = instruction.opcode.value
+            if opcode in self.namespace.flag_reading_operations or opcode in self.namespace.control_flow_operations:
+                return False
+            if opcode in self.namespace.flag_setting_operations:
+                return True
+        return False
+
+
+class RedundantLoadElimination(OptimizationPass):
+    """
+    Removes loads of a value, that is already in the accumulator.
+
+    All (flag, value) pairs known to be equal to the accumulator are tracked:
+    the last load, and memory cells the accumulator was stored to.
+    They are forgotten after any accumulator modifying instruction, or at a label.
+    Memory cells are also forgotten after instructions, that may write memory behind compiler's back
+    """
+
+    name: str = "redundant-load-elimination"
+    level: int = 1
+
+    def run(self, instructions: list[TaggedInstruction | Tag]) -> list[TaggedInstruction | Tag]:
+        loading = set(self.namespace.variable_loading.values())
+        storing = set(self.namespace.variable_making)
+        non_modifying = self.namespace.non_modifying_operations
+        memory_modifying = self.namespace.memory_modifying_operations
+
+        optimized = []
+        accumulator = set()
+        for instruction in instructions:
+            # labels may be jumped to from anywhere
+            if isinstance(instruction, Tag):
+                accumulator = set()
+                optimized.append(instruction)
+                continue
+
+            opcode = instruction.opcode.value
+            if opcode in loading:
+                loaded = (instruction.flag, instruction.value.value, instruction.value.type)
+                if loaded in accumulator:
+                    continue
+                accumulator = {loaded}
+            elif opcode in storing:
+                # store always writes to memory, no matter the flag
+                accumulator.add((True, instruction.value.value, instruction.value.type))
+            elif opcode not in non_modifying:
+                accumulator = set()
+            elif opcode in memory_modifying:
+                accumulator = {value for value in accumulator if not value[0]}
+            optimized.append(instruction)
+        return optimized
+
+
+class ImmediateFolding(OptimizationPass):
+    """
+    Folds consecutive immediate arithmetic, like 'add 1' 'sub 3' 'add 10', into a single instruction.
+    Folded instructions are removed completely if they cancel out.
+    Only done when flags of the last folded instruction are never read
+    """
+
+    name: str = "immediate-folding"
+    level: int = 2
+
+    def run(self, instructions: list[TaggedInstruction | Tag]) -> list[TaggedInstruction | Tag]:
+        folding = self.namespace.folding_operations
+        if not folding:
+            return instructions
+        modulo = self.namespace.max_int + 1
+        operations = {sign: opcode for opcode, sign in folding.items()}
+
+        optimized = []
+        idx = 0
+        while idx < len(instructions):
+            # find the run of foldable instructions
+            end = idx
+            total = 0
+            while end < len(instructions):
+                instruction = instructions[end]
+                if isinstance(instruction, Tag) or instruction.opcode.value not in folding:
+                    break
+                immediate = self._get_immediate(instruction)
+                if immediate is None:
+                    break
+                total += folding[instruction.opcode.value] * immediate
+                end += 1
+
+            if end - idx < 2 or not self._flags_dead(instructions, end - 1):
+                optimized.append(instructions[idx])
+                idx += 1
+                continue
+
+            # replace the run with a single instruction
+            total %= modulo
+            if total:
+                self.rewritten += 1
+                if -1 in operations and (total > modulo // 2 or 1 not in operations):
+                    opcode, value = operations[-1], modulo - total
+                else:
+                    opcode, value = operations[1], total
+                optimized.append(TaggedInstruction(
+                    flag=False,
+                    value=Tag(str(value), TagType.POINTER),
+                    opcode=Tag(opcode, TagType.BUILT_IN),
+                    line=instructions[idx].line,
+                    origin=instructions[idx].origin,
+                    file=instructions[idx].file))
+            idx = end
+        return optimized
+
+
+class StrengthReduction(OptimizationPass):
+    """
+    Replaces expensive operations with power of two immediates by cheaper ones,
+    like 'mul 32' by 'lsl 5', 'div 256' by 'lsr 8' and 'mod 16' by 'and 15'.
+    Shifts by zero are removed.
+    Only done when flags of the replaced instruction are never read, as they may differ
+    """
+
+    name: str = "strength-reduction"
+    level: int = 2
+
+    def run(self, instructions: list[TaggedInstruction | Tag]) -> list[TaggedInstruction | Tag]:
+        reductions = self.namespace.strength_reductions
+        if not reductions:
+            return instructions
+
+        optimized = []
+        for idx, instruction in enumerate(instructions):
+            if isinstance(instruction, Tag) or instruction.opcode.value not in reductions:
+                optimized.append(instruction)
+                continue
+
+            # only positive powers of two
+            immediate = self._get_immediate(instruction)
+            if not immediate or immediate & (immediate - 1) or not self._flags_dead(instructions, idx):
+                optimized.append(instruction)
+                continue
+
+            opcode, kind = reductions[instruction.opcode.value]
+            if kind == "shift":
+                value = immediate.bit_length() - 1
+                if value == 0:
+                    continue
+            else:
+                value = immediate - 1
+            self.rewritten += 1
+            optimized.append(TaggedInstruction(
+                flag=False,
+                value=Tag(str(value), TagType.POINTER),
+                opcode=Tag(opcode, TagType.BUILT_IN),
+                line=instruction.line,
+                origin=instruction.origin,
+                file=instruction.file))
+        return optimized
+
+
+class DeadStoreElimination(OptimizationPass):
+    """
+    Removes stores to variables, that are never read afterwards,
+    and loads, which values are overwritten before being used.
+
+    Uses liveness analysis over the control flow graph of the code block,
+    so values are tracked across jumps and loops.
+    Removal may make other instructions dead, so it's repeated until nothing changes.
+    Only done for cpu's, which control flow is described by the code namespace
+    """
+
+    name: str = "dead-store-elimination"
+    level: int = 2
+
+    def run(self, instructions: list[TaggedInstruction | Tag]) -> list[TaggedInstruction | Tag]:
+        if not self.namespace.jump_operations:
+            return instructions
+
+        while dead := self._find_dead(instructions):
+            instructions = [instruction for idx, instruction in enumerate(instructions) if idx not in dead]
+        return instructions
+
+    def _find_dead(self, instructions: list[TaggedInstruction | Tag]) -> set[int]:
+        """
+        Finds indices of dead stores and loads
+        """
+
+        loading = set(self.namespace.variable_loading.values())
+        storing = set(self.namespace.variable_making)
+
+        liveness = Liveness(ControlFlowGraph(instructions, self.namespace))
+        dead = set()
+        for block in liveness.cfg.blocks:
+            live = set(block.live_out)
+            for idx in range(block.end - 1, block.start - 1, -1):
+                instruction = instructions[idx]
+                if isinstance(instruction, Tag):
+                    continue
+                opcode = instruction.opcode.value
+
+                # only stores to variables; stores to numeric addresses may be memory mapped devices
+                if (opcode in storing and instruction.value.type is TagType.VARIABLE and
+                        instruction.value.value not in live):
+                    dead.add(idx)
+                elif opcode in loading and ACCUMULATOR not in live:
+                    dead.add(idx)
+                else:
+                    liveness.transfer(instruction, live)
+        return dead
+
+
+# all optimization passes, in order they are run
+PASSES: list[type[OptimizationPass]] = [
+    RedundantLoadElimination,
+    ImmediateFolding,
+    StrengthReduction,
+    DeadStoreElimination,
+]
+
+
+class PassManager:
+    """
+    Runs optimization passes, that are enabled at given optimization level, in order.
+    Statistics are accumulated over all code blocks
+    """
+
+    def __init__(self, namespace: CodeNamespace, level: int = 0):
+        self.level: int = level
+        self.passes: list[OptimizationPass] = [
+            pass_class(namespace) for pass_class in PASSES if pass_class.level <= level]
+        self.statistics: dict[str, PassStatistics] = {
+            optimization_pass.name: PassStatistics(optimization_pass.name) for optimization_pass in self.passes}
+
+    def run(self, instructions: list[TaggedInstruction | Tag]) -> list[TaggedInstruction | Tag]:
+        """
+        Runs all enabled passes over instructions of a code block
+        :param instructions: instructions of a code block
+        :return: optimized instructions
+        """
+
+        for optimization_pass in self.passes:
+            statistics = self.statistics[optimization_pass.name]
+            count = len(instructions)
+
+            start_time = perf_counter()
+            instructions = optimization_pass.run(instructions)
+            statistics.elapsed += perf_counter() - start_time
+
+            statistics.runs += 1
+            statistics.removed += count - len(instructions)
+            statistics.rewritten = optimization_pass.rewritten
+        return instructions
+
+    def report(self):
+        """
+        Logs statistics of every pass
+        """
+
+        for statistics in self.statistics.values():
+            LOGGER.debug(f"{statistics.name}: {statistics.removed} instructions removed, "
+                         f"{statistics.rewritten} rewritten in {statistics.elapsed * 1000:.2f} ms "
+                         f"({statistics.runs} blocks)")
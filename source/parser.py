@@ -22,6 +22,19 @@ class Parser:
 
         self.current_scope = scope
 
+    @staticmethod
+    def _get_indent_level(word: Word) -> int:
+        """
+        Returns amount of leading indent tags in a word
+        """
+
+        level = 0
+        for tag in word:
+            if not (tag.type is TagType.INTERNAL and tag.value == ">"):
+                break
+            level += 1
+        return level
+
     def _parse_first_stage(self):
         """
         First stage of parsing
@@ -31,63 +44,76 @@ class Parser:
 
         for word in self.current_scope:
             word: Word  # help type hinting
+            level = self._get_indent_level(word)
 
             # check 'macro' and 'subr' keywords
-            if word[0].value in ["macro", "subr"]:
-                if len(word) < 2:
+            if len(word) > level and word[level].value in ["macro", "subr"]:
+                if len(word) < level + 2:
                     raise CompilerSyntaxError(
-                        f"built-in '{word[0].value}' without name defined",
+                        f"built-in '{word[level].value}' without name defined",
                         line=word.line)
-                elif word[1].type is not TagType.POINTER:
+                elif word[level + 1].type is not TagType.POINTER:
                     raise CompilerSyntaxError(
-                        f"built-in '{word[0].value}' followed by a non-pointer argument",
+                        f"built-in '{word[level].value}' followed by a non-pointer argument",
                         line=word.line)
 
     def _parse_second_stage(self):
         """
         Second stage of parsing
 
-        Builds AST
+        Builds AST in one forward pass.
+        Keeps a stack of open scopes, one for every indentation level
         """
 
-        idx = -1
-        while idx < len(self.current_scope)-1:
-            idx += 1
-            word: Word = self.current_scope[idx]
+        root = self.current_scope.__class__()
+        scopes: list[Scope] = [root]
+        header: Word | None = None  # 'macro' or 'subr' word, that is waiting for its body
+
+        for word in self.current_scope:
+            word: Word  # help type hinting
+
+            # get rid of indent tags
+            level = self._get_indent_level(word)
+            if level > 0:
+                del word.tags[:level]
 
             # get rid of zero-length words
             if len(word) == 0:
-                self.current_scope.pop(idx)
-                idx -= 1
                 continue
 
-            # create macro and subroutine scopes
-            if word[0].value in ["macro", "subr"]:
+            # open macro or subroutine scope
+            if header is not None:
                 # check for correct indent after the keyword
-                if idx < len(self.current_scope):
-                    next_word = self.current_scope[idx + 1]
-                    if next_word[0].type is not TagType.INTERNAL and next_word[0].value != ">":
-                        raise CompilerIndentationError(
-                            "Expected indent, got nothing",
-                            line=word.line)
-
-                # create scope
-                idx += 1
-                scope = MacroScope() if word[0].value == "macro" else SubroutineScope()
-                for word_ in self.current_scope[idx:]:
-                    word_: Word  # help type hinting
-                    if not (word_[0].type is TagType.INTERNAL and word_[0].value == ">"):
-                        break
-                    word_.pop(0)
-                    scope.add(self.current_scope.pop(idx))
-
-                # insert back into current scope
-                self.current_scope.insert(idx, scope)
-            elif word[0].type is TagType.INTERNAL and word[0].value == ">":
+                if level < len(scopes):
+                    raise CompilerIndentationError(
+                        "Expected indent, got nothing",
+                        line=header.line)
+                scope = MacroScope() if header[0].value == "macro" else SubroutineScope()
+                scopes[-1].add(scope)
+                scopes.append(scope)
+                header = None
+
+            # close finished scopes
+            elif level < len(scopes) - 1:
+                del scopes[level + 1:]
+
+            if level != len(scopes) - 1:
                 raise CompilerIndentationError(
                     "Unexpected indent",
                     line=word.line)
 
+            scopes[-1].add(word)
+            if word[0].value in ["macro", "subr"]:
+                header = word
+
+        # check for scope at the end of the code
+        if header is not None:
+            raise CompilerIndentationError(
+                "Expected indent, got nothing",
+                line=header.line)
+
+        self.current_scope = root
+
     def partial_parse(self):
         """
         Skips first stage of parsing
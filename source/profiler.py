@@ -0,0 +1,212 @@
+"""
+Source level profiling of compiled programs
+"""
+
+
+import os
+import logging
+from dataclasses import dataclass
+from source.classes import *
+from source.built_ins import *
+from source.emulator import Emulator
+
+
+LOGGER = logging.getLogger("profiler")
+
+
+@dataclass
+class HotSpot:
+    """
+    Execution statistics of a single source line, within a single origin
+    """
+
+    file: str
+    line: int
+    origin: str
+    instructions: int = 0
+    cycles: int = 0
+    address: int = 0  # first address of instructions from the line
+
+
+class Profiler:
+    """
+    Runs a program in the emulator, counting executed instructions of every address,
+    separately for every call stack.
+
+    Call stacks are made of call target addresses, and are followed through 'call' and 'return' instructions.
+    Cycles are estimated from cycle tables of the code namespace.
+    With source files, lines and origins of addresses (see 'Compiler.files', 'Compiler.lines' and 'Compiler.origins'),
+    counts are mapped back to the source, and to macros and subroutines instructions were expanded from
+    """
+
+    def __init__(self, emulator: Emulator,
+                 lines: list[int] | None = None,
+                 origins: list[str] | None = None,
+                 symbols: dict[str, int] | None = None,
+                 files: list[str] | None = None):
+        """
+        :param emulator: emulator with loaded program
+        :param lines: address -> source line
+        :param origins: address -> origin of the instruction
+        :param symbols: subroutine and label names -> addresses
+        :param files: address -> source file
+        """
+
+        self.emulator: Emulator = emulator
+        size = len(emulator.program)
+        self.files: list[str] = files if files is not None else [""] * size
+        self.lines: list[int] = lines if lines is not None else [-1] * size
+        self.origins: list[str] = origins if origins is not None else [""] * size
+
+        # call target address -> subroutine name
+        self.subroutines: dict[int, str] = {
+            address: name for name, address in (symbols or dict()).items() if not name.startswith("@")}
+
+        # call stack -> execution counts of every address
+        self.stacks: dict[tuple[int, ...], list[int]] = dict()
+
+        # estimated cycles of every address
+        namespace = emulator.namespace
+        names = {definition.opcode: name for name, definition in namespace.definitions.items()}
+        self.costs: list[int] = [
+            namespace.instruction_cycles.get(names.get(instruction.opcode), 1) +
+            (namespace.memory_operand_cycles if instruction.flag else 0)
+            for instruction in emulator.bytecode]
+
+    def run(self, max_steps: int | None = None) -> int:
+        """
+        Runs the program until it halts, or until the step limit is reached
+        :param max_steps: maximal amount of instructions to execute; None for no limit
+        :return: amount of executed instructions
+        """
+
+        emulator = self.emulator
+        program = emulator.program
+        memory = emulator.memory
+        size = len(program)
+        limit = max_steps if max_steps is not None else -1
+
+        subr_operations = emulator.namespace.subr_operations
+        definitions = emulator.namespace.definitions
+        call = emulator.handlers[definitions[subr_operations["call"]].opcode]
+        ret = emulator.handlers[definitions[subr_operations["return"]].opcode]
+
+        stack = tuple(emulator.call_stack)
+        counts = self.stacks.setdefault(stack, [0] * size)
+
+        steps = 0
+        try:
+            while steps != limit and not emulator.halted:
+                pc = emulator.pc
+                if pc >= size:
+                    emulator.halted = True
+                    break
+                handler, flag, value = program[pc]
+                emulator.pc = pc + 1
+                handler(memory[value] if flag else value, value)
+                counts[pc] += 1
+                steps += 1
+
+                # switch to counts of the new call stack
+                if handler is call:
+                    stack += (emulator.pc,)
+                    counts = self.stacks.setdefault(stack, [0] * size)
+                elif handler is ret and stack:
+                    stack = stack[:-1]
+                    counts = self.stacks.setdefault(stack, [0] * size)
+        finally:
+            emulator.steps += steps
+        return steps
+
+    def get_counts(self) -> list[int]:
+        """
+        Returns execution counts of every address, over all call stacks
+        """
+
+        return [sum(column) for column in zip(*self.stacks.values())] if self.stacks else []
+
+    def get_hot_spots(self) -> list[HotSpot]:
+        """
+        Returns statistics of source lines, ranked by estimated cycles
+        """
+
+        hot_spots = dict()
+        for address, count in enumerate(self.get_counts()):
+            if not count:
+                continue
+            # addresses without source line are shown on their own
+            file, line, origin = self.files[address], self.lines[address], self.origins[address]
+            key = (file, line, origin, -1 if line > 0 else address)
+            if (hot_spot := hot_spots.get(key)) is None:
+                hot_spot = hot_spots[key] = HotSpot(file, line, origin, address=address)
+            hot_spot.instructions += count
+            hot_spot.cycles += count * self.costs[address]
+        return sorted(hot_spots.values(), key=lambda x: (-x.cycles, x.address))
+
+    @staticmethod
+    def get_location(file: str, line: int) -> str:
+        """
+        Returns 'file:line' name of a source line
+        """
+
+        if line <= 0:
+            return "-"
+        return f"{os.path.relpath(file) if file else '?'}:{line}"
+
+    def report(self, sources: dict[str, list[str]] | None = None, top: int = 20):
+        """
+        Logs a table of the hottest source lines
+        :param sources: source file path -> lines of the file, to show next to line numbers
+        :param top: amount of shown lines
+        """
+
+        hot_spots = self.get_hot_spots()
+        total_cycles = sum(hot_spot.cycles for hot_spot in hot_spots) or 1
+        total_instructions = sum(hot_spot.instructions for hot_spot in hot_spots) or 1
+
+        LOGGER.info(f"{'cycles':>12} {'%':>6} {'instructions':>12} {'%':>6}  {'address':<7} {'location':<24} "
+                    f"{'origin':<32} source")
+        for hot_spot in hot_spots[:top]:
+            text = ""
+            source = sources.get(hot_spot.file) if sources is not None else None
+            if source is not None and 0 < hot_spot.line <= len(source):
+                text = source[hot_spot.line - 1].strip()
+            LOGGER.info(f"{hot_spot.cycles:>12} {hot_spot.cycles / total_cycles:>6.1%} "
+                        f"{hot_spot.instructions:>12} {hot_spot.instructions / total_instructions:>6.1%}  "
+                        f"0x{hot_spot.address:04X}  {self.get_location(hot_spot.file, hot_spot.line):<24} "
+                        f"{hot_spot.origin or '-':<32} {text}")
+        LOGGER.info(f"{total_instructions} instructions, {total_cycles} estimated cycles")
+
+    def _get_frame_name(self, address: int) -> str:
+        return self.subroutines.get(address, f"0x{address:04X}")
+
+    def write_collapsed(self, file: str, name: str = "main") -> int:
+        """
+        Writes estimated cycles in collapsed stack format, used by flamegraph tools.
+        Frames are subroutine calls, then macros and inlined subroutines from origin, then source file and line
+        :param file: output filepath
+        :param name: name of the root frame
+        :return: amount of written stacks
+        """
+
+        collapsed = dict()
+        for stack, counts in self.stacks.items():
+            frames = [name] + [self._get_frame_name(address) for address in stack]
+            for address, count in enumerate(counts):
+                if not count:
+                    continue
+
+                # first part of origin is the subroutine, which is already in the stack unless it was inlined
+                origin = self.origins[address].split("/") if self.origins[address] else []
+                if origin and origin[0] == frames[-1]:
+                    origin = origin[1:]
+                line = self.lines[address]
+                leaf = self.get_location(self.files[address], line) if line > 0 else f"0x{address:04X}"
+
+                key = ";".join(frames + origin + [leaf])
+                collapsed[key] = collapsed.get(key, 0) + count * self.costs[address]
+
+        with open(file, "w") as f:
+            for key, cycles in collapsed.items():
+                f.write(f"{key} {cycles}\n")
+        return len(collapsed)
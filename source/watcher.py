@@ -0,0 +1,95 @@
+"""
+File watching for live compilation
+"""
+
+
+import os
+from time import sleep
+from hashlib import blake2b
+from typing import Iterable
+
+
+class FileWatcher:
+    """
+    Watches files for changes.
+    Files are polled with cheap 'stat' calls; contents are hashed only when the stat changes,
+    so touching a file without modifying it doesn't count as a change
+    """
+
+    def __init__(self, paths: Iterable[str] = (), poll_interval: float = 0.02):
+        self.poll_interval: float = poll_interval
+        self.stats: dict[str, tuple[int, int] | None] = dict()
+        self.hashes: dict[str, bytes | None] = dict()
+        self.watch(paths)
+
+    @staticmethod
+    def _get_stat(path: str) -> tuple[int, int] | None:
+        """
+        Returns modification time and size of a file, or None if it doesn't exist
+        """
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    @staticmethod
+    def _get_hash(path: str) -> bytes | None:
+        """
+        Returns content hash of a file, or None if it can't be read
+        """
+
+        try:
+            with open(path, "rb") as file:
+                return blake2b(file.read(), digest_size=16).digest()
+        except OSError:
+            return None
+
+    def watch(self, paths: Iterable[str], since: int | None = None):
+        """
+        Replaces the set of watched files, keeping the state of files that were already watched
+        :param paths: file paths
+        :param since: time in nanoseconds, when files were read; new files, that were modified after it,
+        are reported as changed by the next check, as they may have been read before the modification
+        """
+
+        stats, hashes = dict(), dict()
+        for path in paths:
+            path = os.path.abspath(path)
+            if path in self.stats:
+                stats[path], hashes[path] = self.stats[path], self.hashes[path]
+                continue
+
+            stat = self._get_stat(path)
+            if since is not None and stat is not None and stat[0] >= since:
+                stats[path], hashes[path] = None, None
+            else:
+                stats[path], hashes[path] = stat, self._get_hash(path)
+        self.stats, self.hashes = stats, hashes
+
+    def changed(self) -> bool:
+        """
+        Checks all watched files for changes
+        :return: True if any file contents changed since the last check
+        """
+
+        changed = False
+        for path, old_stat in self.stats.items():
+            stat = self._get_stat(path)
+            if stat == old_stat:
+                continue
+            self.stats[path] = stat
+            new_hash = self._get_hash(path)
+            if new_hash != self.hashes[path]:
+                self.hashes[path] = new_hash
+                changed = True
+        return changed
+
+    def wait(self):
+        """
+        Blocks until any of the watched files changes
+        """
+
+        while not self.changed():
+            sleep(self.poll_interval)
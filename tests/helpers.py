@@ -0,0 +1,76 @@
+"""
+Shared helpers of the tests
+"""
+
+
+from typing import TextIO
+from source.lexer import Lexer
+from source.parser import Parser
+from source.linker import Linker
+from source.compiler import Compiler
+from source.optimizer import PassManager
+from source.emulator import Emulator
+from source.built_ins import *
+
+
+def compile_code(code: str | TextIO, level: int = 0, path: str | None = None,
+                 namespace: CodeNamespace | None = None) -> Compiler:
+    """
+    Lexes, parses and compiles a program
+    :param code: program source, or a file with it
+    :param level: optimization level
+    :param path: source file path, for included files
+    :param namespace: code namespace; QT by default
+    :return: compiler, after 'compile' was called
+    """
+
+    namespace = namespace if namespace is not None else NamespaceQT()
+    lexer = Lexer()
+    lexer.code_namespace = namespace
+    lexer.import_code(code)
+    lexer.evaluate()
+
+    parser = Parser()
+    parser.import_scope(lexer.current_scope)
+    parser.parse()
+
+    compiler = Compiler()
+    compiler.code_namespace = namespace
+    compiler.source_path = path
+    compiler.linker = Linker(namespace)
+    compiler.optimizer = PassManager(namespace, level)
+    compiler.import_scope(parser.current_scope)
+    compiler.compile()
+    return compiler
+
+
+def compile_file(path: str, level: int = 0, namespace: CodeNamespace | None = None) -> Compiler:
+    """
+    Compiles a source file
+    """
+
+    with open(path, "r", encoding="ascii") as file:
+        return compile_code(file, level, path, namespace)
+
+
+def get_instructions(compiler: Compiler) -> list[tuple[str, object]]:
+    """
+    Returns (opcode name, value) of every compiled instruction
+    """
+
+    return [(instruction.opcode.value, instruction.value.value) for instruction in compiler.instructions]
+
+
+def run_code(code: str, level: int = 0, namespace: CodeNamespace | None = None,
+             max_steps: int = 100_000) -> Emulator:
+    """
+    Compiles a program, and runs it in the emulator until it halts
+    :return: emulator, after the program was run
+    """
+
+    compiler = compile_code(code, level, namespace=namespace)
+    emulator = Emulator(compiler.code_namespace, compiler.bytecode)
+    emulator.run(max_steps)
+    if not emulator.halted:
+        raise AssertionError(f"Program didn't halt in {max_steps} steps")
+    return emulator
@@ -0,0 +1,48 @@
+"""
+Tests of data memory allocation
+"""
+
+
+import unittest
+from tests.helpers import compile_code
+
+
+SEQUENTIAL_CALLS = """\
+load 1
+store $x
+call f uses $x
+call h uses $x
+halt
+
+subr f uses a
+    load $a
+    store $b
+    load $b
+    add $a
+    return
+
+subr h uses c
+    load $c
+    store $d
+    load $d
+    add $c
+    return
+"""
+
+
+class TestVariableAllocator(unittest.TestCase):
+    def test_sequential_subroutine_locals_share_cells(self):
+        # at -O3 both subroutines are inlined
+        for level in range(3):
+            with self.subTest(level=level):
+                compiler = compile_code(SEQUENTIAL_CALLS, level)
+                variables = compiler.variables
+                self.assertTrue({variables["f:a"], variables["f:b"]} & {variables["h:c"], variables["h:d"]})
+                self.assertLessEqual(compiler.data_memory_size, 3)
+
+                # argument is still read after the first call
+                self.assertNotIn(variables["x"], (variables["f:a"], variables["f:b"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+Tests of the compilation cache
+"""
+
+
+import os
+import sys
+import tempfile
+import unittest
+import subprocess
+from unittest import mock
+from source.cache import CompileCache
+from source.file_io import load
+
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+class TestCompileCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_directory_is_not_scanned_on_every_write(self):
+        cache = CompileCache(self.directory.name, max_size=1024)
+        with mock.patch("source.cache.os.scandir", wraps=os.scandir) as scandir:
+            for idx in range(20):
+                cache.put_dependencies(f"key{idx}", ["a.ql"])
+        # only the first write scans the directory
+        self.assertEqual(scandir.call_count, 1)
+        self.assertEqual(cache.size, sum(entry.stat().st_size for entry in os.scandir(self.directory.name)))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = CompileCache(self.directory.name, max_size=250)
+        for idx in range(3):
+            cache.put_dependencies(f"key{idx}", ["x" * 90])
+            os.utime(os.path.join(self.directory.name, f"key{idx}.deps"), ns=(idx, idx))
+        self.assertIsNone(cache.get_dependencies("key0"))
+        self.assertIsNotNone(cache.get_dependencies("key2"))
+        self.assertLessEqual(cache.size, cache.max_size)
+
+    def test_overwritten_entry_is_counted_once(self):
+        cache = CompileCache(self.directory.name)
+        cache.put_dependencies("key", ["a.ql"])
+        cache.put_dependencies("key", ["b.ql"])
+        self.assertEqual(cache.size, os.path.getsize(os.path.join(self.directory.name, "key.deps")))
+
+
+class TestApplicationCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name: str, code: str) -> str:
+        path = os.path.join(self.directory.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as file:
+            file.write(code)
+        return path
+
+    def compile(self, path: str) -> bytes:
+        output_path = os.path.splitext(path)[0] + ".bin"
+        subprocess.run([sys.executable, MAIN_PATH, "-i", path, "-o", output_path,
+                        "--cache", os.path.join(self.directory.name, "cache")],
+                       check=True, capture_output=True)
+        return bytes(load(output_path)[0])
+
+    def test_equal_sources_in_different_directories(self):
+        # includes are resolved relative to the including file
+        paths = []
+        for name, value in [("a", 1), ("b", 2)]:
+            paths.append(self.write(f"{name}/main.ql", '#include "lib.ql"\nhalt\n'))
+            self.write(f"{name}/lib.ql", f"load {value}\n")
+
+        bytecode_a = self.compile(paths[0])
+        bytecode_b = self.compile(paths[1])
+        self.assertNotEqual(bytecode_a, bytecode_b)
+        self.assertEqual(self.compile(paths[0]), bytecode_a)
+
+
+if __name__ == '__main__':
+    unittest.main()
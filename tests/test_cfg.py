@@ -0,0 +1,147 @@
+"""
+Tests of control flow graphs, liveness analysis and dead store elimination
+"""
+
+
+import unittest
+from source.classes import *
+from source.built_ins import *
+from source.cfg import ControlFlowGraph, Liveness, ACCUMULATOR
+from source.optimizer import DeadStoreElimination
+from tests.helpers import run_code
+
+
+def make_instructions(code: str) -> list[TaggedInstruction | Tag]:
+    """
+    Makes instructions of a code block, like the compiler does before addresses are resolved.
+    '$name' is a variable, '@name' is a label; memory is read by 'load' only
+    """
+
+    instructions = []
+    for line in code.splitlines():
+        parts = line.split()
+        if len(parts) == 1 and parts[0].startswith("@"):
+            instructions.append(Tag(parts[0], TagType.POINTER))
+            continue
+        opcode, argument = parts[0], parts[1] if len(parts) > 1 else None
+        if argument is None:
+            value, flag = Tag(0, TagType.INTERNAL), False
+        elif argument.startswith("$"):
+            value, flag = Tag(argument[1:], TagType.VARIABLE), opcode == "load"
+        else:
+            value, flag = Tag(argument, TagType.POINTER), False
+        instructions.append(TaggedInstruction(flag, value, Tag(opcode, TagType.BUILT_IN)))
+    return instructions
+
+
+def get_text(instructions: list[TaggedInstruction | Tag]) -> list[str]:
+    """
+    Turns instructions back into lines of code
+    """
+
+    lines = []
+    for instruction in instructions:
+        if isinstance(instruction, Tag):
+            lines.append(instruction.value)
+        elif instruction.value.type is TagType.INTERNAL:
+            lines.append(instruction.opcode.value)
+        else:
+            prefix = "$" if instruction.value.type is TagType.VARIABLE else ""
+            lines.append(f"{instruction.opcode.value} {prefix}{instruction.value.value}")
+    return lines
+
+
+LOOP = """\
+load 10
+store $n
+@loop
+load $n
+sub 1
+store $n
+loadpr @loop
+jumpc 0b0001
+load $n
+portw 0
+halt
+"""
+
+
+class TestControlFlowGraph(unittest.TestCase):
+    def setUp(self):
+        self.namespace = NamespaceQT()
+
+    def test_blocks_and_successors(self):
+        cfg = ControlFlowGraph(make_instructions(LOOP), self.namespace)
+        self.assertEqual([(block.start, block.end) for block in cfg.blocks], [(0, 2), (2, 8), (8, 11)])
+        self.assertEqual(cfg.labels, {"@loop": 1})
+        self.assertEqual([block.successors for block in cfg.blocks], [[1], [1, 2], []])
+        self.assertEqual([block.predecessors for block in cfg.blocks], [[], [0, 1], [1]])
+        self.assertFalse(any(block.exits for block in cfg.blocks))
+
+    def test_unknown_targets_exit(self):
+        cfg = ControlFlowGraph(make_instructions("load 1\nloadpr 100\njumpc 0b0001\nreturn\n"), self.namespace)
+        self.assertTrue(all(block.exits for block in cfg.blocks))
+
+    def test_end_of_block_exits(self):
+        cfg = ControlFlowGraph(make_instructions("load 1\nstore $x\n"), self.namespace)
+        self.assertEqual(len(cfg.blocks), 1)
+        self.assertTrue(cfg.blocks[0].exits)
+
+
+class TestLiveness(unittest.TestCase):
+    def setUp(self):
+        self.namespace = NamespaceQT()
+
+    def test_loop_variable_is_live_around_the_loop(self):
+        liveness = Liveness(ControlFlowGraph(make_instructions(LOOP), self.namespace))
+        blocks = liveness.cfg.blocks
+        self.assertIn("n", blocks[0].live_out)
+        self.assertIn("n", blocks[1].live_out)
+        self.assertEqual(blocks[2].live_out, set())
+
+    def test_everything_is_live_at_exits(self):
+        liveness = Liveness(ControlFlowGraph(make_instructions("load 1\nstore $x\nreturn\n"), self.namespace))
+        self.assertEqual(liveness.cfg.blocks[0].live_out, liveness.universe)
+        self.assertTrue({ACCUMULATOR, "x"} <= liveness.universe)
+
+    def test_known_call_effects(self):
+        instructions = make_instructions("load 1\nstore $x\nload 2\nstore $y\ncall @f\nhalt\n")
+        liveness = Liveness(ControlFlowGraph(instructions, self.namespace), call_effects={"@f": {"y"}})
+        live = set()
+        for instruction in reversed(instructions[2:]):
+            liveness.transfer(instruction, live)
+        self.assertNotIn("x", live)
+        self.assertNotIn("y", live)
+
+        live = set()
+        liveness.transfer(instructions[4], live)
+        self.assertEqual(live, {"y", ACCUMULATOR})
+
+
+class TestDeadStoreElimination(unittest.TestCase):
+    def run_pass(self, code: str) -> list[str]:
+        return get_text(DeadStoreElimination(NamespaceQT()).run(make_instructions(code)))
+
+    def test_unread_store_is_removed(self):
+        self.assertEqual(self.run_pass("load 1\nstore $x\nload 2\nportw 0\nhalt\n"),
+                         ["load 2", "portw 0", "halt"])
+
+    def test_overwritten_load_is_removed(self):
+        self.assertEqual(self.run_pass("load $x\nload 2\nportw 0\nhalt\n"), ["load 2", "portw 0", "halt"])
+
+    def test_store_to_address_is_kept(self):
+        self.assertEqual(self.run_pass("load 1\nstore 200\nhalt\n"), ["load 1", "store 200", "halt"])
+
+    def test_loop_is_kept(self):
+        self.assertEqual(self.run_pass(LOOP), get_text(make_instructions(LOOP)))
+
+    def test_stores_before_exits_are_kept(self):
+        self.assertEqual(self.run_pass("load 1\nstore $x\nreturn\n"), ["load 1", "store $x", "return"])
+
+    def test_same_output_at_o2(self):
+        code = "load 3\nstore $unused\n" + LOOP.replace("load 10", "load 3")
+        self.assertEqual(run_code(code, 2).ports, run_code(code, 0).ports)
+
+
+if __name__ == '__main__':
+    unittest.main()
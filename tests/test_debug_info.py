@@ -0,0 +1,90 @@
+"""
+Tests of debug information files
+"""
+
+
+import os
+import tempfile
+import unittest
+from source.debug_info import DebugInfo
+from source.exceptions import *
+from tests.helpers import compile_file
+
+
+LIBRARY = """\
+#define ONE 1
+macro dbl uses v
+    load v
+    add v
+    store v
+"""
+
+MAIN = """\
+#include "lib/math.ql"
+load 0
+store $x
+dbl uses $x
+load $x
+add ONE
+store $x
+halt
+"""
+
+
+class TestDebugInfo(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.main_path = os.path.join(self.directory.name, "main.ql")
+        self.library_path = os.path.join(self.directory.name, "lib", "math.ql")
+        os.mkdir(os.path.dirname(self.library_path))
+        with open(self.main_path, "w") as file:
+            file.write(MAIN)
+        with open(self.library_path, "w") as file:
+            file.write(LIBRARY)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip_with_included_macro(self):
+        compiler = compile_file(self.main_path)
+        debug_path = os.path.join(self.directory.name, "main.dbg")
+        DebugInfo.from_compiler(compiler).save(debug_path)
+
+        info = DebugInfo.load(debug_path)
+        self.assertEqual(info.size, len(compiler.instructions))
+        self.assertEqual(info.files, compiler.files)
+        self.assertEqual(info.lines, compiler.lines)
+        self.assertEqual(info.origins, compiler.origins)
+        self.assertEqual(info.symbols, compiler.symbols)
+        self.assertEqual(info.variables, compiler.variables)
+
+        # 'load 0' 'store $x', then the macro body from the included file
+        main_path = os.path.abspath(self.main_path)
+        library_path = os.path.abspath(self.library_path)
+        self.assertEqual([(info.get_file(address), info.get_line(address)) for address in range(info.size)], [
+            (main_path, 2), (main_path, 3),
+            (library_path, 3), (library_path, 4), (library_path, 5),
+            (main_path, 5), (main_path, 6), (main_path, 7), (main_path, 8)])
+        self.assertEqual(info.get_origin(2), "dbl")
+
+    def test_sections_are_loaded_lazily(self):
+        compiler = compile_file(self.main_path)
+        debug_path = os.path.join(self.directory.name, "main.dbg")
+        DebugInfo.from_compiler(compiler).save(debug_path)
+
+        info = DebugInfo.load(debug_path)
+        self.assertIsNone(info._line_ranges)
+        self.assertEqual(info.get_line(0), 2)
+        self.assertIsNotNone(info._line_ranges)
+        self.assertIsNone(info._origin_ranges)
+
+    def test_unsupported_version(self):
+        debug_path = os.path.join(self.directory.name, "main.dbg")
+        with open(debug_path, "wb") as file:
+            file.write(b"QDBG\x01\x00\x00\x00\x00\x00")
+        with self.assertRaises(CompilerValueError):
+            DebugInfo.load(debug_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
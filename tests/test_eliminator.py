@@ -0,0 +1,92 @@
+"""
+Tests of dead subroutine and unreachable code elimination
+"""
+
+
+import unittest
+from tests.helpers import compile_code, get_instructions, run_code
+
+
+UNUSED = """\
+call a
+portw 0
+halt
+load 9
+
+subr a
+    add 1
+    return
+
+subr unused
+    add 2
+    call unused_callee
+    return
+
+subr unused_callee
+    add 3
+    return
+"""
+
+POINTER_REFERENCE = """\
+loadpr @done
+jump @done
+load 9
+@done
+call b
+portw 0
+halt
+
+subr b
+    loadpr @b_end
+    jumpc 0b0001
+    add 1
+    @b_end
+    return
+"""
+
+FALL_THROUGH = """\
+call first
+portw 0
+call second
+portw 1
+halt
+
+subr first
+    add 1
+
+subr second
+    add 2
+    return
+"""
+
+
+class TestDeadCodeEliminator(unittest.TestCase):
+    def test_unused_subroutines_are_removed(self):
+        self.assertEqual(set(compile_code(UNUSED, 0).symbols), {"a", "unused", "unused_callee"})
+        compiler = compile_code(UNUSED, 1)
+        self.assertEqual(set(compiler.symbols), {"a"})
+        self.assertEqual(get_instructions(compiler),
+                         [("call", 3), ("portw", "0"), ("halt", 0), ("add", "1"), ("return", 0)])
+
+    def test_referenced_labels_are_kept(self):
+        compiler = compile_code(POINTER_REFERENCE, 1)
+        instructions = get_instructions(compiler)
+        self.assertNotIn(("load", "9"), instructions)
+        self.assertIn("b", compiler.symbols)
+        self.assertIn(("add", "1"), instructions)
+        self.assertEqual(run_code(POINTER_REFERENCE, 1).ports, run_code(POINTER_REFERENCE, 0).ports)
+
+    def test_block_reached_by_falling_through_is_kept(self):
+        expected = run_code(FALL_THROUGH, 0).ports
+        self.assertEqual(expected, {0: 3, 1: 5})
+        for level in range(1, 4):
+            with self.subTest(level=level):
+                self.assertEqual(run_code(FALL_THROUGH, level).ports, expected)
+
+    def test_disabled_at_o0(self):
+        instructions = get_instructions(compile_code(UNUSED, 0))
+        self.assertIn(("load", "9"), instructions)
+
+
+if __name__ == '__main__':
+    unittest.main()
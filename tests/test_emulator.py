@@ -0,0 +1,125 @@
+"""
+Tests of the bytecode emulator
+"""
+
+
+import os
+import tempfile
+import unittest
+from source.classes import *
+from source.built_ins import *
+from source.exceptions import *
+from source.emulator import Emulator, CARRY, SIGN, ZERO
+from source.file_io import dump
+from tests.helpers import compile_code, run_code
+
+
+SUM_LOOP = """\
+load 0
+store $sum
+load 5
+store $n
+@loop
+load $sum
+add $n
+store $sum
+load $n
+sub 1
+store $n
+comp 1
+loadpr @end
+jumpc 0b1000 ; exit when n < 1
+jump @loop
+@end
+load $sum
+portw 0
+halt
+"""
+
+
+class TestEmulatorQT(unittest.TestCase):
+    def test_arithmetic_wraps_and_sets_flags(self):
+        emulator = run_code("load 0xFFFF\nadd 2\nhalt\n")
+        self.assertEqual(emulator.acc, 1)
+        self.assertEqual(emulator.flags, CARRY)
+
+        emulator = run_code("load 1\nsub 1\nhalt\n")
+        self.assertEqual(emulator.flags, ZERO)
+
+        emulator = run_code("load 0\nsub 1\nhalt\n")
+        self.assertEqual(emulator.acc, 0xFFFF)
+        self.assertEqual(emulator.flags, CARRY | SIGN)
+
+    def test_memory_and_stack(self):
+        emulator = run_code("load 7\nstore $x\npush\nload 3\nadd $x\nstore $y\npop\nportw 0\nload $y\nportw 1\nhalt\n")
+        self.assertEqual(emulator.ports, {0: 7, 1: 10})
+
+    def test_loop(self):
+        self.assertEqual(run_code(SUM_LOOP).ports, {0: 15})
+
+    def test_subroutine_call(self):
+        code = "call twice uses 21\nportw 0\nhalt\n\nsubr twice uses v\n    add $v\n    return\n"
+        emulator = run_code(code)
+        self.assertEqual(emulator.ports, {0: 42})
+        self.assertEqual(emulator.stack, [])
+        self.assertEqual(emulator.call_stack, [])
+
+    def test_hooks(self):
+        compiler = compile_code("portr 3\nadd 1\nportw 4\nint 2\nhalt\n")
+        emulator = Emulator(compiler.code_namespace, compiler.bytecode)
+        written = []
+        emulator.port_read_hooks[3] = lambda _: 41
+        emulator.port_write_hooks[4] = lambda _, value: written.append(value)
+        emulator.run()
+        self.assertEqual(written, [42])
+        self.assertEqual(emulator.interrupts, 1)
+
+    def test_step_limit_and_end_of_program(self):
+        compiler = compile_code("load 1\nadd 1\nadd 1\n")
+        emulator = Emulator(compiler.code_namespace, compiler.bytecode)
+        self.assertEqual(emulator.run(2), 2)
+        self.assertFalse(emulator.halted)
+        self.assertEqual(emulator.run(), 1)
+        self.assertTrue(emulator.halted)
+        self.assertEqual((emulator.acc, emulator.steps), (3, 3))
+
+    def test_errors(self):
+        compiler = compile_code("load 1\npop\n")
+        emulator = Emulator(compiler.code_namespace, compiler.bytecode)
+        with self.assertRaises(EmulatorError) as context:
+            emulator.run()
+        self.assertEqual(context.exception.line, 1)
+
+        namespace = NamespaceQT()
+        bytecode = Bytecode(namespace.instruction_class, bytearray(namespace.instruction_class.record.pack(0, 0, 0xFF)))
+        with self.assertRaises(EmulatorError):
+            Emulator(namespace, bytecode).run()
+
+    def test_from_file(self):
+        compiler = compile_code("load 5\nmul 3\nportw 0\nhalt\n")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "program.bin")
+            dump(compiler.bytecode, path, compiler.code_namespace)
+            emulator = Emulator.from_file(path)
+        emulator.run()
+        self.assertEqual(emulator.ports, {0: 15})
+
+    def test_reset(self):
+        compiler = compile_code("load 5\nstore $x\nportw 0\nhalt\n")
+        emulator = Emulator(compiler.code_namespace, compiler.bytecode)
+        emulator.run()
+        emulator.reset()
+        self.assertEqual((emulator.acc, emulator.pc, emulator.steps, emulator.halted), (0, 0, 0, False))
+        self.assertEqual(emulator.ports, {})
+        self.assertFalse(any(emulator.memory))
+
+
+class TestEmulatorQM(unittest.TestCase):
+    def test_arithmetic_and_output(self):
+        emulator = run_code("LRA 200\nADD 100\nUO\nHALT\n", namespace=NamespaceQMr11())
+        self.assertEqual(emulator.output, [44])
+        self.assertTrue(emulator.flags & CARRY)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+"""
+Tests of the #define expression evaluator
+"""
+
+
+import unittest
+from source.expression import evaluate
+from source.exceptions import *
+from tests.helpers import compile_code
+
+
+class TestEvaluate(unittest.TestCase):
+    def test_precedence(self):
+        self.assertEqual(evaluate("1 + 2 * 3"), 7)
+        self.assertEqual(evaluate("(1 + 2) * 3"), 9)
+        self.assertEqual(evaluate("1 | 2 ^ 3 & 4 << 1"), 1 | 2 ^ 3 & 4 << 1)
+        self.assertEqual(evaluate("-2 ** 2"), -4)
+        self.assertEqual(evaluate("2 ** 3 ** 2"), 512)
+        self.assertEqual(evaluate("~0x0F & 0xFF"), 0xF0)
+
+    def test_literals(self):
+        self.assertEqual(evaluate("0x10 + 0b11 + 0o7 + 1_000"), 16 + 3 + 7 + 1000)
+
+    def test_division(self):
+        self.assertEqual(evaluate("-7 / 2"), -3)
+        self.assertEqual(evaluate("-7 // 2"), -4)
+        self.assertEqual(evaluate("-7 % 2"), 1)
+        with self.assertRaises(CompilerValueError):
+            evaluate("1 / 0")
+
+    def test_names(self):
+        names = {"BASE": 0x100, "STEP": "2"}
+        self.assertEqual(evaluate("BASE + STEP", names.get), 0x102)
+        with self.assertRaises(CompilerNameError):
+            evaluate("BASE + MISSING", names.get)
+
+    def test_limits(self):
+        with self.assertRaises(CompilerValueError):
+            evaluate("1 << 100000")
+        with self.assertRaises(CompilerValueError):
+            evaluate("10 ** 100000")
+
+    def test_syntax_errors(self):
+        for expression in ["1 +", "(1", "1)", "1 $ 2", "* 2"]:
+            with self.subTest(expression=expression), self.assertRaises(CompilerSyntaxError):
+                evaluate(expression)
+
+    def test_deep_nesting(self):
+        with self.assertRaises(CompilerSyntaxError):
+            evaluate("(" * 5000 + "1" + ")" * 5000)
+
+
+class TestDefineExpressions(unittest.TestCase):
+    def test_define_uses_earlier_defines(self):
+        compiler = compile_code("#define BASE 0x10\n#define ADDR BASE * 2 + 1\nload ADDR\nhalt\n")
+        self.assertEqual(compiler.instructions[0].value.value, str(0x21))
+
+    def test_deep_nesting_is_reported_with_line(self):
+        code = "load 0\n#define X " + "(" * 5000 + "1" + ")" * 5000 + " + 1\nhalt\n"
+        with self.assertRaises(CompilerSyntaxError) as context:
+            compile_code(code)
+        self.assertEqual(context.exception.line, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
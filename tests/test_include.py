@@ -0,0 +1,51 @@
+"""
+Tests of file inclusion
+"""
+
+
+import os
+import tempfile
+import unittest
+from source.exceptions import *
+from tests.helpers import compile_file
+
+
+class TestInclude(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name: str, code: str | bytes) -> str:
+        path = os.path.join(self.directory.name, name)
+        with open(path, "wb" if isinstance(code, bytes) else "w") as file:
+            file.write(code)
+        return path
+
+    def test_diamond_include_is_spliced_once(self):
+        self.write("d.ql", "#define ONE 1\nload ONE\n")
+        self.write("b.ql", '#include "d.ql"\nadd 2\n')
+        self.write("c.ql", '#include "d.ql"\nadd 3\n')
+        path = self.write("a.ql", '#include "b.ql"\n#include "c.ql"\nhalt\n')
+
+        compiler = compile_file(path)
+        self.assertEqual(len(compiler.instructions), 4)  # 'load 1' 'add 2' 'add 3' 'halt'
+        self.assertEqual(compiler.dependencies, [
+            os.path.join(self.directory.name, name) for name in ("b.ql", "d.ql", "c.ql")])
+
+    def test_include_cycle(self):
+        self.write("b.ql", '#include "a.ql"\n')
+        path = self.write("a.ql", '#include "b.ql"\nhalt\n')
+        with self.assertRaises(CompilerIncludeError):
+            compile_file(path)
+
+    def test_undecodable_include(self):
+        self.write("b.ql", b"load \xff\xfe\n")
+        path = self.write("a.ql", '#include "b.ql"\nhalt\n')
+        with self.assertRaises(CompilerIncludeError):
+            compile_file(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+"""
+Tests of subroutine inlining
+"""
+
+
+import unittest
+from tests.helpers import compile_code, get_instructions, run_code
+
+
+TWO_PARAMETERS = """\
+call f uses 5 7
+portw 0
+halt
+
+subr f uses x y
+    add $y
+    return
+"""
+
+THREE_PARAMETERS = """\
+load 20
+store $a
+call g uses $a 5 3
+portw 0
+call g uses 9 $a 1
+portw 1
+halt
+
+subr g uses p q r
+    sub $q
+    sub $r
+    return
+"""
+
+MANY_RETURNS = """\
+call m uses 3
+portw 0
+call m uses 30
+portw 1
+halt
+
+subr m uses v
+    comp 10
+    loadpr @small
+    jumpc 0b1000
+    load 1
+    return
+    @small
+    load 2
+    return
+"""
+
+RECURSIVE = """\
+call r uses 3
+halt
+
+subr r uses n
+    load $n
+    sub 1
+    store $n
+    call r uses $n
+    return
+"""
+
+
+class TestSubroutineInliner(unittest.TestCase):
+    def assert_same_output(self, code: str):
+        expected = run_code(code, 0).ports
+        for level in range(1, 4):
+            with self.subTest(level=level):
+                self.assertEqual(run_code(code, level).ports, expected)
+
+    def test_first_parameter_is_left_in_the_accumulator(self):
+        self.assertEqual(run_code(TWO_PARAMETERS, 0).ports, {0: 12})
+        self.assert_same_output(TWO_PARAMETERS)
+
+        compiler = compile_code(TWO_PARAMETERS, 3)
+        self.assertEqual(compiler.inlined, 1)
+        self.assertNotIn("call", [opcode for opcode, _ in get_instructions(compiler)])
+
+    def test_three_parameters(self):
+        self.assert_same_output(THREE_PARAMETERS)
+        self.assertEqual(compile_code(THREE_PARAMETERS, 3).inlined, 2)
+
+    def test_returns_in_the_middle(self):
+        self.assert_same_output(MANY_RETURNS)
+        self.assertEqual(compile_code(MANY_RETURNS, 3).inlined, 2)
+
+    def test_recursive_subroutine_is_not_inlined(self):
+        compiler = compile_code(RECURSIVE, 3)
+        self.assertEqual(compiler.inlined, 0)
+        self.assertIn("call", [opcode for opcode, _ in get_instructions(compiler)])
+
+    def test_large_subroutine_called_twice_is_not_inlined(self):
+        body = "".join(f"    add {idx}\n" for idx in range(20))
+        code = f"call big uses 1\nportw 0\ncall big uses 2\nportw 1\nhalt\n\nsubr big uses v\n{body}    return\n"
+        self.assertEqual(compile_code(code, 3).inlined, 0)
+        self.assert_same_output(code)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+Tests of arithmetic optimization passes
+"""
+
+
+import unittest
+from source.built_ins import *
+from tests.helpers import compile_code, get_instructions, run_code
+
+
+ARITHMETIC = """\
+load 5
+store $x
+load $x
+mul 8
+add 1
+add 2
+sub 3
+div 4
+mod 16
+and 255
+portw 0
+load $x
+add 3
+sub 1
+jumpc 0b0001
+halt
+"""
+
+
+class TestStrengthReduction(unittest.TestCase):
+    def test_power_of_two_immediates(self):
+        instructions = get_instructions(compile_code(ARITHMETIC, 2))
+        self.assertIn(("lsl", "3"), instructions)
+        self.assertIn(("lsr", "2"), instructions)
+        self.assertIn(("and", "15"), instructions)
+        self.assertFalse({"mul", "div", "mod"} & {opcode for opcode, _ in instructions})
+
+    def test_shift_by_zero_is_removed(self):
+        instructions = get_instructions(compile_code("load 5\nmul 1\nand 255\nportw 0\nhalt\n", 2))
+        self.assertEqual(instructions, [("load", "5"), ("and", "255"), ("portw", "0"), ("halt", 0)])
+
+    def test_other_immediates_are_kept(self):
+        instructions = get_instructions(compile_code("load 5\nmul 6\nand 255\nportw 0\nhalt\n", 2))
+        self.assertIn(("mul", "6"), instructions)
+
+    def test_disabled_below_o2(self):
+        instructions = get_instructions(compile_code(ARITHMETIC, 1))
+        self.assertIn(("mul", "8"), instructions)
+
+
+class TestImmediateFolding(unittest.TestCase):
+    def test_cancelling_run_is_removed(self):
+        instructions = get_instructions(compile_code(ARITHMETIC, 2))
+        self.assertNotIn(("add", "1"), instructions)
+        self.assertNotIn(("sub", "3"), instructions)
+
+    def test_run_is_folded(self):
+        instructions = get_instructions(compile_code("load 5\nadd 1\nadd 2\nsub 1\nand 255\nportw 0\nhalt\n", 2))
+        self.assertEqual(instructions, [("load", "5"), ("add", "2"), ("and", "255"), ("portw", "0"), ("halt", 0)])
+
+    def test_negative_total_uses_sub(self):
+        instructions = get_instructions(compile_code("load 5\nadd 1\nsub 4\nand 255\nportw 0\nhalt\n", 2))
+        self.assertIn(("sub", "3"), instructions)
+
+    def test_flags_read_afterwards(self):
+        # carry of the last 'sub' is read by 'jumpc'
+        instructions = get_instructions(compile_code(ARITHMETIC, 2))
+        self.assertEqual(instructions[-4:-1], [("add", "3"), ("sub", "1"), ("jumpc", "1")])
+
+    def test_disabled_on_qm(self):
+        code = "LRA 5\nADD 1\nADD 2\nAND 255\nHLT\n"
+        self.assertEqual(get_instructions(compile_code(code, 2, namespace=NamespaceQMr11())),
+                         get_instructions(compile_code(code, 0, namespace=NamespaceQMr11())))
+
+
+class TestOutput(unittest.TestCase):
+    def test_same_output_at_all_levels(self):
+        expected = run_code(ARITHMETIC, 0).ports
+        for level in range(1, 4):
+            with self.subTest(level=level):
+                self.assertEqual(run_code(ARITHMETIC, level).ports, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
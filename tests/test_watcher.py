@@ -0,0 +1,45 @@
+"""
+Tests of file watching
+"""
+
+
+import os
+import tempfile
+import unittest
+from time import time_ns
+from source.watcher import FileWatcher
+
+
+class TestFileWatcher(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.main_path = self.write("main.ql", "halt\n")
+        self.include_path = self.write("lib.ql", "load 1\n")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name: str, code: str) -> str:
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w") as file:
+            file.write(code)
+        return path
+
+    def test_include_changed_during_compilation(self):
+        watcher = FileWatcher([self.main_path])
+        compile_start = time_ns()
+        self.write("lib.ql", "load 2\n")  # saved while the compilation is running
+
+        watcher.watch([self.main_path, self.include_path], since=compile_start)
+        self.assertTrue(watcher.changed())
+        self.assertFalse(watcher.changed())
+
+    def test_include_unchanged(self):
+        os.utime(self.include_path, ns=(0, 0))
+        watcher = FileWatcher([self.main_path])
+        watcher.watch([self.main_path, self.include_path], since=time_ns())
+        self.assertFalse(watcher.changed())
+
+
+if __name__ == '__main__':
+    unittest.main()